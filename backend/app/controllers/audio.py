@@ -1,10 +1,15 @@
 import logging
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import (
+    APIRouter,
+    WebSocket,
+    WebSocketDisconnect,
+    WebSocketException,
+    status,
+)
 
-from ..services import transcription
-from ..services.audio import microphones, player, speakers
-from ..services.events import EventHandler
+from ..services import sessions
+from ..services.audio import microphones, monitor
 from ..services.websocket import WebSocketConnection
 
 LOGGER = logging.getLogger(__name__)
@@ -15,26 +20,45 @@ router = APIRouter()
 @router.websocket("/audio")
 async def stream_audio(websocket: WebSocket):
     socket = WebSocketConnection(websocket)
-    try:
-        mic, config, mic_token = await microphones.create_websocket_mic(socket)
+    try:  # start the session's speaker and transcription
+        session = await sessions.manager.start(socket)
+    except sessions.SessionLimitError as e:
+        LOGGER.warning("Audio source refused: %s", e)
+        raise WebSocketException(
+            reason="Too many audio sessions",
+            code=status.WS_1013_TRY_AGAIN_LATER,
+        )
+    except microphones.DecoderLimitError as e:
+        LOGGER.warning("Audio source refused: %s", e)
+        return
     except WebSocketDisconnect:
         return
-    LOGGER.info("Microphone connected")
-
-    # start speaker and transcription
-    audio_event, player_token = await player.start_audio_player(mic)
-    speaker_token = await speakers.start_speaker(config, audio_event)
-    LOGGER.info("Speaker started")
-    transcription_token = await transcription.start(config, audio_event)
-    LOGGER.info("Transcription started")
-
-    async def shutdown():
-        await transcription_token()
-        await speaker_token()
-        await player_token()
-        await mic_token()
-
-    shutdown_callback = EventHandler(shutdown, one_shot=True)
-    await socket.disconnection_event.subscribe(shutdown_callback)
+    LOGGER.info("Microphone connected to session %s", session.id)
+
     await socket.disconnection_event.until_triggered()
     LOGGER.info("Audio source disconnected")
+
+
+@router.websocket("/audio/monitor")
+async def monitor_audio(
+    websocket: WebSocket, codec: str = "pcm", session: str | None = None
+):
+    if codec not in monitor.CODECS:
+        raise WebSocketException(
+            reason=f"Invalid codec: {codec}",
+            code=status.WS_1003_UNSUPPORTED_DATA,
+        )
+    if (audio_session := sessions.manager.get(session)) is None:
+        raise WebSocketException(
+            reason="Audio session is not running",
+            code=status.WS_1013_TRY_AGAIN_LATER,
+        )
+
+    socket = WebSocketConnection(websocket)
+    await socket.connect()
+    LOGGER.info("Audio monitor listener connected")
+    try:
+        await audio_session.monitor.listen(socket, codec)
+    except WebSocketDisconnect:
+        pass
+    LOGGER.info("Audio monitor listener disconnected")
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, status
+
+from ..services.audio import clips
+
+router = APIRouter()
+
+
+@router.get("/clips")
+async def get_clips():
+    return {
+        "clips": list(clips.library.clips()),
+        "cache": clips.library.stats(),
+    }
+
+
+@router.post("/clips/{name}/play")
+async def play_clip(name: str):
+    try:
+        duration = await clips.play(name)
+    except FileNotFoundError as e:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, str(e)) from e
+    except ValueError as e:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, str(e)
+        ) from e
+    return {"clip": name, "duration": duration}
@@ -0,0 +1,53 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Response, status
+
+from ..services import sessions
+from ..services.audio import archive
+
+router = APIRouter()
+
+
+@router.get("/sessions")
+async def get_sessions():
+    return {
+        "max_sessions": sessions.MAX_SESSIONS,
+        "default": getattr(sessions.manager.default, "id", None),
+        "sessions": [s.info() for s in sessions.manager.sessions.values()],
+    }
+
+
+@router.get("/sessions/archive")
+async def get_archived_sessions():
+    return await asyncio.to_thread(archive.list_sessions)
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    if (session := sessions.manager.get(session_id)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Session is not running: {session_id}",
+        )
+    return session.info()
+
+
+@router.get("/sessions/{session_id}/archive")
+async def get_session_archive(session_id: str):
+    try:
+        return await asyncio.to_thread(archive.load_index, session_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, str(e)) from e
+
+
+@router.get("/sessions/{session_id}/archive/audio")
+async def get_session_audio(session_id: str, start: float, end: float):
+    try:
+        audio = await asyncio.to_thread(
+            archive.read_range, session_id, start, end
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e)) from e
+    return Response(audio, media_type="audio/wav")
@@ -1,16 +1,17 @@
-import asyncio
 import logging
 
 from fastapi import (
     APIRouter,
+    Header,
+    HTTPException,
     WebSocket,
-    WebSocketDisconnect,
     WebSocketException,
     status,
 )
+from fastapi.responses import StreamingResponse
 
+from ..services import sessions
 from ..services import transcription as transcription_service
-from ..services.events import EventHandler
 from ..services.websocket import WebSocketConnection
 
 LOGGER = logging.getLogger(__name__)
@@ -19,31 +20,62 @@ router = APIRouter()
 
 
 @router.websocket("/transcription")
-async def stream_transcription(websocket: WebSocket):
-    transcription_event = transcription_service.event()
-    if transcription_event is None:
-        LOGGER.error("Transcription requested but service is not running")
+async def stream_transcription(
+    websocket: WebSocket, session: str | None = None
+):
+    # follow the default session if none is selected
+    hub = sessions.manager.default_hub
+    if session is not None:
+        if (transcription_session := sessions.manager.get(session)) is None:
+            LOGGER.error("Transcription requested for unknown session")
+            raise WebSocketException(
+                reason=f"Session is not running: {session}",
+                code=status.WS_1008_POLICY_VIOLATION,
+            )
+        hub = transcription_session.transcript_hub
+    if hub.clients >= sessions.MAX_SESSION_VIEWERS:
         raise WebSocketException(
-            reason="Transcription service is not running",
-            code=status.WS_1002_PROTOCOL_ERROR,
+            reason="Too many transcription clients",
+            code=status.WS_1013_TRY_AGAIN_LATER,
         )
 
     socket = WebSocketConnection(websocket)
     await socket.connect()
-    handler = EventHandler(socket.send)
-    await transcription_event.subscribe(handler)
     LOGGER.info("Transcription client connected")
+    await hub.serve(socket)  # until the client disconnects
+    LOGGER.info("Transcription client disconnected")
 
-    async def stop():
-        await transcription_event.unsubscribe(handler)
-        LOGGER.info("Transcription client disconnected")
 
-    stop_callback = EventHandler(stop, one_shot=True)
-    await socket.disconnection_event.subscribe(stop_callback)
+@router.get("/transcription/events")
+async def stream_transcription_events(
+    session: str | None = None,
+    last_event_id: int | None = Header(None, alias="Last-Event-ID"),
+):
+    # follow the default session if none is selected
+    stream = sessions.manager.default_stream
+    if session is not None:
+        if (transcription_session := sessions.manager.get(session)) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Session is not running: {session}",
+            )
+        stream = transcription_session.transcript_stream
+    if stream.clients >= sessions.MAX_SESSION_VIEWERS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many transcription clients",
+        )
+
+    return StreamingResponse(
+        stream.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    while True:
-        try:  # keep connection alive
-            await socket.send("")
-        except WebSocketDisconnect:
-            break
-        await asyncio.sleep(1)
+@router.get("/transcription/stats")
+async def get_transcription_stats():
+    return transcription_service.stats() | {
+        "broadcast": sessions.manager.default_hub.stats(),
+        "stream": {"clients": sessions.manager.default_stream.clients},
+    }
@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,15 +7,33 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 from . import FRONTEND
-from .controllers import audio, configurator, control, transcription
+from .controllers import (
+    audio,
+    clips,
+    configurator,
+    control,
+    sessions,
+    transcription,
+)
+from .services.transcription import engines
 
 api_app = FastAPI(title="backend")
 api_app.include_router(control.router)
 api_app.include_router(transcription.router)
 api_app.include_router(configurator.router)
 api_app.include_router(audio.router)
+api_app.include_router(sessions.router)
+api_app.include_router(clips.router)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    engines.start_engines()  # run the recognition engines while serving
+    yield
+    engines.stop_engines()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.mount("/api", api_app, name="api")
 app.mount("/", StaticFiles(directory=FRONTEND, html=True), name="frontend")
 
@@ -11,9 +11,16 @@ class Config:
     transcription_engine: str = "whisper"
     """The transcription engine to use."""
 
+    secondary_engine: str = ""
+    """The transcription engine that slow or failing requests of the primary
+    engine are sent to. Disabled if empty."""
+
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     """The OpenAI API key."""
 
+    upload_codec: str = "flac"
+    """The codec of audio uploaded to the Whisper API (flac, opus or wav)."""
+
     audio_device: int = int(
         pyaudio.PyAudio().get_default_output_device_info()["index"]
     )
@@ -13,3 +13,15 @@ class MicrophoneConfig:
     """The number of channels of the microphone."""
     chunk_size: int = 1024
     """The chunk size of the microphone."""
+    encoding: str = "webm"
+    """The encoding of the audio sent by the microphone. Either `webm` for
+    MediaRecorder WebM/Opus chunks, or `pcm` for raw little-endian PCM frames
+    prefixed with a header (see `PCM_HEADER`)."""
+    device_id: str = ""
+    """The identifier of the capturing device or room. Used to cache the
+    calibration of the microphone across sessions."""
+
+
+PCM_HEADER = "<Id"
+"""The struct format of the header of raw PCM frames: the frame's sequence
+number (uint32) followed by its capture timestamp (float64, milliseconds)."""
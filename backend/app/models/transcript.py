@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class TranscriptDelta:
+    """Transcript update model. Describes a change to the text of a phrase
+    relative to the previous revision of that phrase."""
+
+    phrase_id: int
+    """The identifier of the updated phrase."""
+    revision: int
+    """The revision of the phrase, incremented with every update."""
+    stable_length: int
+    """The number of characters of the previous revision that are kept."""
+    text: str
+    """The text that replaces the previous revision after its kept prefix."""
+    start: float
+    """The start of the phrase in the audio stream (seconds)."""
+    end: float
+    """The end of the transcribed audio of the phrase in the stream
+    (seconds)."""
+    final: bool = False
+    """Whether the phrase ended. No more updates follow a final update."""
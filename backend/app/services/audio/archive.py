@@ -0,0 +1,341 @@
+"""
+Audio archive service.
+
+Archives the audio and transcripts of sessions for review and
+re-transcription. The audio of a session is written to fixed-duration
+segment files under `data/archive/<session>/`, and the session's index file
+(`index.jsonl`) maps time offsets to segment files and transcripts, one JSON
+record per line:
+
+- `{"type": "session", ...}`: The audio configuration of the session.
+- `{"type": "segment", "file": ..., "start": ...}`: A segment file and its
+  start offset in the session (seconds).
+- `{"type": "transcript", "start": ..., "end": ..., "text": ...}`: The final
+  transcript of a phrase and its time window in the session (seconds).
+- `{"type": "end", "duration": ...}`: The duration of the session (seconds),
+  once it stopped.
+
+Any time window of a session can be read back without reading whole segment
+files. The archive's size is bounded by deleting the oldest segments.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import threading
+import time
+from dataclasses import asdict
+
+from ... import data_dir
+from ...models.microphone import MicrophoneConfig
+from ...models.transcript import TranscriptDelta
+from ..events import Event, EventHandler
+from . import LOGGER
+from .recordings import WAV_HEADER_SIZE, AudioFileWriter, wav_header
+
+ARCHIVE_DIR = os.path.join(data_dir, "archive")
+"""The directory of archived sessions."""
+SEGMENT_DURATION = 60
+"""The duration of archived segment files (seconds)."""
+ARCHIVE_CODEC = "flac"
+"""The codec of archived segment files (`wav` or `flac`)."""
+ARCHIVE_SESSIONS = os.getenv("ARCHIVE_SESSIONS", "True").lower() == "true"
+"""Whether the audio and transcripts of sessions are archived."""
+MAX_ARCHIVE_SIZE = int(os.getenv("MAX_ARCHIVE_SIZE", 2 * 2**30))
+"""The maximum size of the archive (bytes). The oldest segments are deleted
+when it's exceeded."""
+MAX_RANGE_DURATION = 600
+"""The maximum duration of audio read from the archive at a time (seconds)."""
+INDEX_FILE = "index.jsonl"
+"""The name of the index file of archived sessions."""
+
+
+async def start_archive(
+    session_id: str,
+    mic_config: MicrophoneConfig,
+    audio_event: Event[bytes],
+    transcript_event: Event[TranscriptDelta],
+):
+    """Start archiving the audio and transcripts of a session.
+
+    Args:
+        session_id (str): The identifier of the session.
+        mic_config (MicrophoneConfig): The audio configuration.
+        audio_event (Event[bytes]): The session's audio event.
+        transcript_event (Event[TranscriptDelta]): The session's transcript
+            event.
+
+    Returns:
+        CancellationToken: The cancellation token to stop archiving.
+    """
+    session_dir = os.path.join(ARCHIVE_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+    index = _ArchiveIndex(os.path.join(session_dir, INDEX_FILE))
+    index.append(
+        type="session",
+        started=time.time(),
+        codec=ARCHIVE_CODEC,
+        **asdict(mic_config),
+    )
+
+    # write the audio, indexing segments as they are created
+    frame_rate = mic_config.sample_rate
+
+    def on_segment(path: str, start: int):
+        index.append(
+            type="segment",
+            file=os.path.basename(path),
+            start=round(start / frame_rate, 3),
+        )
+        if len(writer.segments) > 1:  # the previous segment is complete
+            _retention.add(writer.segments[-2])
+
+    writer = AudioFileWriter(
+        os.path.join(session_dir, f"audio.{ARCHIVE_CODEC}"),
+        mic_config,
+        ARCHIVE_CODEC,
+        max_segment_duration=SEGMENT_DURATION,
+        on_segment=on_segment,
+    )
+
+    audio_handler = EventHandler(writer.write, threaded=True)
+    await audio_event.subscribe(audio_handler)
+
+    # index the final transcript of every phrase
+    phrases: dict[int, str] = {}  # text of the phrases being transcribed
+
+    async def record_transcript(delta: TranscriptDelta):
+        text = phrases.get(delta.phrase_id, "")
+        text = text[: delta.stable_length] + delta.text
+        if not delta.final:
+            phrases[delta.phrase_id] = text
+            return
+        phrases.pop(delta.phrase_id, None)
+        index.append(
+            type="transcript",
+            start=round(delta.start, 3),
+            end=round(delta.end, 3),
+            text=text,
+        )
+
+    transcript_handler = EventHandler(record_transcript, blocking=True)
+    await transcript_event.subscribe(transcript_handler)
+
+    async def stop():
+        await transcript_event.unsubscribe(transcript_handler)
+        await audio_event.unsubscribe(audio_handler)
+        await asyncio.to_thread(audio_handler.close, True)  # write queued
+        await asyncio.to_thread(writer.close)
+        if writer.segments:
+            await asyncio.to_thread(_retention.add, writer.segments[-1])
+        index.append(type="end", duration=round(writer.frames / frame_rate, 3))
+        LOGGER.debug("Session %s archived", session_id)
+
+    cancellation_event: Event[...] = Event()
+    cancellation_handler = EventHandler(stop, one_shot=True)
+    await cancellation_event.subscribe(cancellation_handler)
+    return cancellation_event
+
+
+def list_sessions() -> list[dict]:
+    """List the archived sessions.
+
+    Returns:
+        list[dict]: The identifier, start time and size of each session.
+    """
+    sessions = []
+    if not os.path.isdir(ARCHIVE_DIR):
+        return sessions
+    for entry in os.scandir(ARCHIVE_DIR):
+        if not entry.is_dir():
+            continue
+        try:
+            info = load_index(entry.name)["session"]
+        except (FileNotFoundError, KeyError, ValueError):
+            continue
+        size = sum(f.stat().st_size for f in os.scandir(entry.path))
+        sessions.append(
+            {"id": entry.name, "started": info["started"], "size": size}
+        )
+    return sorted(sessions, key=lambda session: session["started"])
+
+
+def load_index(session_id: str) -> dict:
+    """Load the index of an archived session.
+
+    Args:
+        session_id (str): The identifier of the session.
+
+    Returns:
+        dict: The session's `session` record, lists of its `segments` and
+            `transcripts` records, and its `duration` (None if the session
+            is running or was interrupted).
+
+    Raises:
+        FileNotFoundError: If the session is not archived.
+    """
+    path = os.path.join(_session_dir(session_id), INDEX_FILE)
+    index: dict = {"segments": [], "transcripts": [], "duration": None}
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written record
+            kind = record.pop("type", None)
+            if kind == "session":
+                index["session"] = record
+            elif kind in ("segment", "transcript"):
+                index[f"{kind}s"].append(record)
+            elif kind == "end":
+                index["duration"] = record["duration"]
+    return index
+
+
+def read_range(session_id: str, start: float, end: float) -> bytes:
+    """Read a time window of the audio of an archived session. Only the
+    window is read from the segment files; audio missing from the archive
+    (e.g. deleted by retention) is replaced with silence.
+
+    Args:
+        session_id (str): The identifier of the session.
+        start (float): The start of the window (seconds).
+        end (float): The end of the window (seconds).
+
+    Returns:
+        bytes: The audio of the window, as a WAV file.
+
+    Raises:
+        FileNotFoundError: If the session is not archived.
+        ValueError: If the window is invalid or too long.
+    """
+    if not 0 <= start < end or end - start > MAX_RANGE_DURATION:
+        raise ValueError(f"Invalid audio range: {start}-{end}")
+
+    index = load_index(session_id)
+    info = index["session"]
+    mic_config = MicrophoneConfig(
+        info["sample_rate"], info["sample_width"], info["num_channels"]
+    )
+    frame_size = mic_config.sample_width * mic_config.num_channels
+    frame_rate = mic_config.sample_rate
+    session_dir = _session_dir(session_id)
+
+    audio = bytearray()
+    segments = index["segments"]
+    for i, segment in enumerate(segments):
+        segment_end = (
+            segments[i + 1]["start"] if i + 1 < len(segments) else end
+        )
+        window_start = max(start, segment["start"])
+        window_end = min(end, segment_end)
+        if window_start >= window_end:
+            continue
+
+        # frames of the window, relative to the segment
+        first = round((window_start - segment["start"]) * frame_rate)
+        count = round((window_end - window_start) * frame_rate)
+        path = os.path.join(session_dir, segment["file"])
+        offset = round((window_start - start) * frame_rate) * frame_size
+        audio += bytes(max(offset - len(audio), 0))  # silence up to segment
+        audio += _read_segment(path, mic_config, first, count)
+    return wav_header(mic_config, len(audio)) + audio
+
+
+def _read_segment(
+    path: str, mic_config: MicrophoneConfig, first: int, count: int
+) -> bytes:
+    # read frames of a segment file, seeking to the first frame
+    frame_size = mic_config.sample_width * mic_config.num_channels
+    size = count * frame_size
+    try:
+        if not os.path.exists(path):  # deleted by retention
+            data = b""
+        elif path.endswith(".wav"):
+            with open(path, "rb") as file:
+                file.seek(WAV_HEADER_SIZE + first * frame_size)
+                data = file.read(size)
+        else:  # decode only the window, limited by its duration
+            rate, width = mic_config.sample_rate, mic_config.sample_width
+            pcm_format = "u8" if width == 1 else f"s{width * 8}le"
+            process = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+                + ["-ss", f"{first / rate:.6f}", "-i", path]
+                + ["-t", f"{count / rate:.6f}"]
+                + ["-f", pcm_format, "pipe:1"],
+                capture_output=True,
+                check=True,
+            )
+            data = process.stdout[:size]
+    except (OSError, subprocess.CalledProcessError) as e:
+        LOGGER.warning("Failed to read archived audio %s: %s", path, e)
+        data = b""
+    return data + bytes(size - len(data))  # pad missing audio with silence
+
+
+def _session_dir(session_id: str) -> str:
+    path = os.path.join(ARCHIVE_DIR, os.path.basename(session_id))
+    if not session_id or not os.path.isdir(path):
+        raise FileNotFoundError(f"Session not archived: {session_id}")
+    return path
+
+
+class _ArchiveRetention:
+    """Bounds the size of the archive, tracking the size of its segment files
+    instead of scanning the archive for every new segment."""
+
+    def __init__(self):
+        self._files: dict[str, int] | None = None  # sizes, oldest first
+        self._size = 0  # size of the tracked files
+        self._lock = threading.Lock()  # added to from audio threads
+
+    def add(self, path: str):
+        """Track a completed segment file, deleting the oldest segments of
+        the archive while it's too large."""
+        with self._lock:
+            if self._files is None:
+                self._files = self._scan()
+                self._size = sum(self._files.values())
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+            self._size += size - self._files.pop(path, 0)
+            self._files[path] = size
+
+            while self._size > MAX_ARCHIVE_SIZE and len(self._files) > 1:
+                old_path = next(iter(self._files))
+                self._size -= self._files.pop(old_path)
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    continue
+                LOGGER.info("Deleted archived audio: %s", old_path)
+
+    def _scan(self) -> dict[str, int]:
+        # the segment files already archived, oldest first
+        files = []
+        for session in os.scandir(ARCHIVE_DIR):
+            if session.is_dir():
+                for entry in os.scandir(session.path):
+                    if entry.name != INDEX_FILE:
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+        return {path: size for _, path, size in sorted(files)}
+
+
+class _ArchiveIndex:
+    """The append-only index file of an archived session."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()  # written from audio and event threads
+
+    def append(self, **record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock, open(self._path, "a") as file:
+            file.write(line)
+
+
+_retention = _ArchiveRetention()  # the retention of the global archive
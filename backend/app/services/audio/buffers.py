@@ -0,0 +1,219 @@
+"""
+Audio buffers.
+
+Provides an adaptive playout buffer for raw PCM audio that arrives in bursts,
+and a mixer that plays clips over a stream of audio.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class JitterBuffer:
+    """An adaptive playout buffer for audio that arrives in bursts.
+
+    Playback starts once the buffer holds the target playout delay. The
+    target adapts to the measured arrival jitter, between the minimum delay
+    and the maximum delay. When the buffer runs dry, silence is played and
+    the buffer refills to the target (stretching the audio). When it holds
+    more than the target, silent blocks are skipped (trimming the audio) and
+    when it exceeds the maximum delay, the oldest audio is dropped. Writes
+    and reads never block, so reads can be made from an audio callback.
+    """
+
+    def __init__(
+        self,
+        frame_rate: int,
+        sample_width: int,
+        num_channels: int,
+        min_delay: float,
+        max_delay: float,
+        silence_threshold: int = 300,
+    ):
+        """
+        Args:
+            frame_rate (int): The sample rate of the audio.
+            sample_width (int): The sample width of the audio, in bytes.
+            num_channels (int): The number of channels of the audio.
+            min_delay (float): The minimum playout delay (seconds).
+            max_delay (float): The maximum playout delay (seconds).
+            silence_threshold (int, optional): The maximum amplitude of
+                samples of silent blocks that can be trimmed. Defaults to 300.
+        """
+        assert 0 < min_delay <= max_delay, "Invalid playout delay"
+
+        self.target_delay = min_delay
+        """The current target playout delay (seconds)."""
+        self.underruns = 0
+        """The number of reads that ran out of audio."""
+        self.overruns = 0
+        """The number of writes that exceeded the maximum delay."""
+        self.trimmed_bytes = 0
+        """The number of bytes of silence skipped to reduce the delay."""
+        self.dropped_bytes = 0
+        """The number of bytes of audio dropped on overruns."""
+
+        self._frame_rate = frame_rate
+        self._frame_size = sample_width * num_channels
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._silence_threshold = silence_threshold
+        self._sample_type = np.dtype(f"<i{sample_width}")
+
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._playing = False  # whether the target delay was buffered
+        self._jitter = 0.0  # smoothed arrival jitter (seconds)
+        self._last_arrival: float | None = None  # last write time
+
+    @property
+    def delay(self) -> float:
+        """The duration of the buffered audio (seconds)."""
+        return len(self._buffer) / (self._frame_rate * self._frame_size)
+
+    def write(self, data: bytes):
+        """Write audio to the buffer."""
+        now = time.monotonic()
+        byte_rate = self._frame_rate * self._frame_size
+
+        with self._lock:
+            # estimate arrival jitter (RFC 3550 interarrival jitter)
+            if self._last_arrival is not None:
+                interval = now - self._last_arrival
+                deviation = abs(interval - len(data) / byte_rate)
+                self._jitter += (deviation - self._jitter) / 16
+                self.target_delay = min(
+                    max(self._min_delay, 2 * self._jitter), self._max_delay
+                )
+            self._last_arrival = now
+
+            self._buffer += data
+            overflow = len(self._buffer) - int(self._max_delay * byte_rate)
+            if overflow > 0:  # drop the oldest audio
+                overflow += -overflow % self._frame_size
+                del self._buffer[:overflow]
+                self.dropped_bytes += overflow
+                self.overruns += 1
+
+    def read(self, num_frames: int) -> bytes:
+        """Read audio for playback, padded with silence if not enough audio
+        is buffered.
+
+        Args:
+            num_frames (int): The number of frames to read.
+
+        Returns:
+            bytes: Exactly `num_frames` frames of audio.
+        """
+        size = num_frames * self._frame_size
+        target = int(self.target_delay * self._frame_rate) * self._frame_size
+
+        with self._lock:
+            if not self._playing:  # wait for the target delay to be buffered
+                if len(self._buffer) < target:
+                    return bytes(size)
+                self._playing = True
+
+            # skip silence while more than the target delay is buffered
+            while len(self._buffer) >= target + 2 * size:
+                if not self._is_silent(size):
+                    break
+                del self._buffer[:size]
+                self.trimmed_bytes += size
+
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            if len(data) < size:  # ran out of audio, refill to target
+                self.underruns += 1
+                self._playing = False
+                data += bytes(size - len(data))
+            return data
+
+    def clear(self):
+        """Discard all buffered audio."""
+        with self._lock:
+            self._buffer.clear()
+            self._playing = False
+
+    def _is_silent(self, size: int) -> bool:
+        count = size // self._sample_type.itemsize
+        samples = np.frombuffer(self._buffer, self._sample_type, count)
+        peak = np.abs(samples.astype(np.int32)).max(initial=0)
+        return int(peak) <= self._silence_threshold
+
+
+class ClipMixer:
+    """Mixes clips of audio into a stream of audio, such as the playback of
+    a speaker. Clips start at the next read of the stream, without waiting
+    for any buffered audio, and are summed with the stream and with each
+    other, saturating at the limits of the samples. Reads never block, so
+    they can be made from an audio callback. Only signed 16 and 32-bit audio
+    can be mixed; mixing is disabled for other sample widths.
+    """
+
+    def __init__(self, sample_width: int, max_clips: int = 8):
+        """
+        Args:
+            sample_width (int): The sample width of the audio, in bytes.
+            max_clips (int, optional): The maximum number of clips played at
+                a time. The oldest clip is stopped when exceeded. Defaults
+                to 8.
+        """
+        self.enabled = sample_width in (2, 4)
+        """Whether clips can be mixed into the audio."""
+
+        self._max_clips = max_clips
+        width = sample_width if self.enabled else 2  # never mixed if not
+        self._sample_type = np.dtype(f"<i{width}")
+        self._limits = np.iinfo(self._sample_type)
+        self._clips: list[memoryview] = []  # the unplayed audio of clips
+        self._lock = threading.Lock()
+
+    @property
+    def playing(self) -> int:
+        """The number of clips being played."""
+        return len(self._clips)
+
+    def play(self, clip: bytes | memoryview):
+        """Start playing a clip. The clip is not copied.
+
+        Args:
+            clip (bytes): The audio of the clip, in the format of the stream.
+
+        Raises:
+            ValueError: If mixing is disabled for the stream's sample width.
+        """
+        if not self.enabled:
+            raise ValueError("Clips can't be mixed into this audio format")
+        with self._lock:
+            self._clips.append(memoryview(clip).cast("B"))
+            del self._clips[: -self._max_clips]
+
+    def stop(self):
+        """Stop playing all clips."""
+        with self._lock:
+            self._clips.clear()
+
+    def mix(self, data: bytes) -> bytes:
+        """Mix the clips being played into audio of the stream.
+
+        Args:
+            data (bytes): The audio of the stream.
+
+        Returns:
+            bytes: The mixed audio, the same size as the stream's audio.
+        """
+        if not self._clips:
+            return data
+
+        size = len(data)
+        mixed = np.frombuffer(data, self._sample_type).astype(np.int64)
+        with self._lock:
+            for clip in self._clips:
+                samples = np.frombuffer(clip[:size], self._sample_type)
+                mixed[: len(samples)] += samples
+            self._clips = [c[size:] for c in self._clips if len(c) > size]
+        mixed = np.clip(mixed, self._limits.min, self._limits.max)
+        return mixed.astype(self._sample_type).tobytes()
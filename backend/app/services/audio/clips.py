@@ -0,0 +1,262 @@
+"""
+Audio clip service.
+
+Plays canned audio clips, such as scripted training prompts and alarm sounds,
+through the speaker. Clips are the audio files in `data/clips/`, named after
+their file name without its extension.
+
+Clips are decoded once, into PCM in the format of the speaker's playback, and
+kept in an LRU cache whose resident size is bounded by `MAX_CACHE_SIZE`.
+Decoded clips larger than `MMAP_THRESHOLD` are stored in `data/clips/.pcm/`
+and memory-mapped instead, so they don't take up memory and are never decoded
+again. The library is decoded in the background in the format of every
+session's speaker when it starts (and of the first clip played), so that
+clips are not decoded when played.
+
+Clips are mixed into the playback of the active speaker, starting at its next
+audio callback, without waiting for the speaker's buffered audio.
+"""
+
+import asyncio
+import mmap
+import os
+from collections import OrderedDict
+
+from pydub import AudioSegment  # type: ignore
+
+from ... import data_dir
+from ...models.microphone import MicrophoneConfig
+from . import LOGGER, speakers
+
+CLIPS_DIR = os.path.join(data_dir, "clips")
+"""The directory of the clip library."""
+DECODED_DIR = os.path.join(CLIPS_DIR, ".pcm")
+"""The directory of decoded clips that are memory-mapped."""
+MAX_CACHE_SIZE = int(os.getenv("MAX_CLIP_CACHE_SIZE", 64 * 2**20))
+"""The maximum size of the decoded clips kept in memory (bytes)."""
+MMAP_THRESHOLD = 2**20
+"""The size of decoded clips above which they are memory-mapped (bytes)."""
+
+_Format = tuple[int, int, int]  # sample rate, sample width, channels
+
+
+class ClipLibrary:
+    """A library of audio clips, decoded on first use and cached."""
+
+    def __init__(
+        self, directory: str = CLIPS_DIR, max_size: int = MAX_CACHE_SIZE
+    ):
+        """
+        Args:
+            directory (str, optional): The directory of the clips. Defaults
+                to CLIPS_DIR.
+            max_size (int, optional): The maximum size of the decoded clips
+                kept in memory (bytes). Defaults to MAX_CACHE_SIZE.
+        """
+        self.hits = 0
+        """The number of clips found in the cache."""
+        self.misses = 0
+        """The number of clips decoded or mapped on demand."""
+        self.evictions = 0
+        """The number of clips evicted from the cache."""
+
+        self._directory = directory
+        self._max_size = max_size
+        self._size = 0  # size of the clips kept in memory
+        self._cache: OrderedDict[tuple, memoryview] = OrderedDict()
+        self._loading: dict[tuple, asyncio.Future] = {}  # clips being loaded
+        self._preloaded: set[_Format] = set()  # formats preloaded
+        self._tasks: set[asyncio.Task] = set()  # running preloads
+
+    def clips(self) -> dict[str, str]:
+        """The clips of the library.
+
+        Returns:
+            dict[str, str]: The path of each clip's file, by clip name.
+        """
+        if not os.path.isdir(self._directory):
+            return {}
+        return {
+            os.path.splitext(entry.name)[0]: entry.path
+            for entry in sorted(
+                os.scandir(self._directory), key=lambda entry: entry.name
+            )
+            if entry.is_file() and not entry.name.startswith(".")
+        }
+
+    async def get(self, name: str, mic_config: MicrophoneConfig):
+        """Get the decoded audio of a clip, decoding it if it's not cached.
+
+        Args:
+            name (str): The name of the clip.
+            mic_config (MicrophoneConfig): The format of the audio.
+
+        Returns:
+            memoryview: The audio of the clip. Not copied, must not be
+                modified.
+
+        Raises:
+            FileNotFoundError: If the clip doesn't exist.
+            ValueError: If the clip can't be decoded.
+        """
+        if (path := self.clips().get(name)) is None:
+            raise FileNotFoundError(f"Clip not found: {name}")
+        key = (name, *_format(mic_config))
+        if (clip := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return clip
+
+        if (loading := self._loading.get(key)) is not None:
+            return await asyncio.shield(loading)  # loaded by another request
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[key] = loading
+        try:
+            clip = await asyncio.to_thread(_load, name, path, mic_config)
+            self.misses += 1
+            self._store(key, clip)
+            loading.set_result(clip)
+            return clip
+        except Exception as e:
+            loading.set_exception(e)
+            loading.exception()  # retrieved, if nobody else awaits it
+            raise
+        finally:
+            self._loading.pop(key, None)
+            if not loading.done():  # cancelled while loading
+                loading.cancel()
+
+    def preload(self, mic_config: MicrophoneConfig):
+        """Decode the clips of the library in the background, until the
+        cache is full. Only done once per format.
+
+        Args:
+            mic_config (MicrophoneConfig): The format of the audio.
+        """
+        clip_format = _format(mic_config)
+        if clip_format in self._preloaded:
+            return
+        self._preloaded.add(clip_format)
+
+        async def preload():
+            for name in self.clips():
+                if self._size >= self._max_size:
+                    break
+                try:
+                    await self.get(name, mic_config)
+                except (FileNotFoundError, ValueError) as e:
+                    LOGGER.warning("Failed to preload clip: %s", e)
+            LOGGER.debug("Clips preloaded (%d bytes)", self._size)
+
+        task = asyncio.create_task(preload())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict[str, int]:
+        """The statistics of the cache."""
+        return {
+            "cached": len(self._cache),
+            "size": self._size,
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, key: tuple, clip: memoryview):
+        self._cache[key] = clip
+        if isinstance(clip.obj, mmap.mmap):
+            return  # mapped clips don't take up memory
+        self._size += len(clip)
+
+        # evict the least recently used clips kept in memory
+        for old_key, old_clip in list(self._cache.items()):
+            if self._size <= self._max_size or old_key == key:
+                break
+            if isinstance(old_clip.obj, mmap.mmap):
+                continue
+            del self._cache[old_key]  # released once played
+            self._size -= len(old_clip)
+            self.evictions += 1
+
+
+async def play(name: str) -> float:
+    """Play a clip through the active speaker, starting a speaker if none is
+    running.
+
+    Args:
+        name (str): The name of the clip.
+
+    Returns:
+        float: The duration of the clip (seconds).
+
+    Raises:
+        FileNotFoundError: If the clip doesn't exist.
+        ValueError: If the clip can't be decoded.
+    """
+    if name not in library.clips():
+        raise FileNotFoundError(f"Clip not found: {name}")
+
+    # decode the clip before starting a speaker, which stops when idle
+    mic_config = speakers.get_clip_format()
+    clip = await library.get(name, mic_config)
+    mixer, output_config = await speakers.get_clip_output()
+    if _format(output_config) != _format(mic_config):  # speakers changed
+        mic_config = output_config
+        clip = await library.get(name, mic_config)
+    mixer.play(clip)
+    library.preload(mic_config)
+    LOGGER.info("Playing clip: %s", name)
+
+    frame_size = mic_config.sample_width * mic_config.num_channels
+    return len(clip) / frame_size / mic_config.sample_rate
+
+
+def _load(name: str, path: str, mic_config: MicrophoneConfig) -> memoryview:
+    # load a clip, mapping it if it was decoded already
+    rate, width, channels = _format(mic_config)
+    decoded_path = os.path.join(
+        DECODED_DIR, f"{name}.{rate}-{width * 8}-{channels}.pcm"
+    )
+    if (
+        os.path.exists(decoded_path)
+        and os.path.getmtime(decoded_path) >= os.path.getmtime(path)
+        and os.path.getsize(decoded_path) > 0
+    ):
+        return _map(decoded_path)
+
+    try:
+        segment = AudioSegment.from_file(path)
+        segment = segment.set_frame_rate(rate).set_channels(channels)
+        audio = segment.set_sample_width(width).raw_data
+    except Exception as e:
+        raise ValueError(f"Invalid clip: {name}") from e
+    LOGGER.debug("Decoded clip: %s (%d bytes)", name, len(audio))
+    if len(audio) <= MMAP_THRESHOLD:
+        return memoryview(audio)
+
+    # store large clips to map them
+    os.makedirs(DECODED_DIR, exist_ok=True)
+    with open(f"{decoded_path}.tmp", "wb") as file:
+        file.write(audio)
+    os.replace(f"{decoded_path}.tmp", decoded_path)
+    return _map(decoded_path)
+
+
+def _map(path: str) -> memoryview:
+    with open(path, "rb") as file:
+        return memoryview(
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        )
+
+
+def _format(mic_config: MicrophoneConfig) -> _Format:
+    return (
+        mic_config.sample_rate,
+        mic_config.sample_width,
+        mic_config.num_channels,
+    )
+
+
+library = ClipLibrary()
+"""The global clip library."""
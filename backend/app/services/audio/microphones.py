@@ -5,71 +5,95 @@ Provides interfaces for various microphone sources.
 """
 
 import asyncio
+import mmap
 import os
+import struct
 import subprocess
+import time
 import wave
+from collections.abc import Callable, Coroutine
 
-from fastapi import WebSocketDisconnect, WebSocketException, status
+from fastapi import WebSocketDisconnect, status
 
-from ...models.microphone import MicrophoneConfig
+from ...models.microphone import PCM_HEADER, MicrophoneConfig
 from ..events import EventHandler
 from ..websocket import WebSocketConnection
 from . import LOGGER
 
+DECODER_STALL_TIMEOUT = 2.5
+"""The maximum time the decoder may hold received audio without producing any
+output before it is considered stalled (seconds)."""
+DECODER_READ_SIZE = 2**14
+"""The maximum size of decoder output read at a time (bytes)."""
+MAX_FRAME_GAP = 1
+"""The maximum duration of missing PCM frames replaced by silence (seconds)."""
+MAX_DECODERS = max((os.cpu_count() or 2) - 1, 1)
+"""The maximum number of decoding processes running at a time, the CPU budget
+of decoding (one core each, leaving a core to the rest of the app)."""
 
-def create_file_mic(filename: str, chunk_size: int = 1024):
-    """Creates a file microphone that returns audio chunks from a file.
+_pcm_header = struct.Struct(PCM_HEADER)
+_riff_chunk = struct.Struct("<4sI")  # RIFF chunk header: identifier, size
+_decoders = 0  # number of running decoding processes
+
+
+def create_file_mic(
+    filename: str,
+    chunk_size: int = 1024,
+    realtime: bool = False,
+    loop: bool = False,
+    start: float = 0.0,
+):
+    """Creates a file microphone that returns audio chunks from a WAV file.
+    See `FileMicrophone`.
 
     Args:
         filename (str): The audio file to read from.
-        chunk_size (int, optional): The chunk size. Defaults to 1024.
+        chunk_size (int, optional): The number of frames per chunk. Defaults
+            to 1024.
+        realtime (bool, optional): Whether chunks are returned at the pace of
+            the audio, like a live microphone. Defaults to False.
+        loop (bool, optional): Whether the file is replayed from its start
+            when it ends. Defaults to False.
+        start (float, optional): The time to start reading from (seconds).
+            Defaults to the start of the file.
 
     Returns:
-        Callable[[], Coroutine[bytes]]: The audio source.
+        Callable[[], Coroutine[memoryview]]: The audio source. Raises
+            `asyncio.CancelledError` once the whole file was read, which
+            stops its player.
         MicrophoneConfig: The audio configuration.
         CancelHandler: The cancellation handler.
     """
-
-    filename = os.path.abspath(os.path.expanduser(filename))
-    with wave.open(filename, "rb") as file:
-        config = MicrophoneConfig(
-            sample_rate=file.getframerate(),
-            chunk_size=chunk_size,
-            sample_width=file.getsampwidth(),
-            num_channels=file.getnchannels(),
-        )
-
-        data = file.readframes(file.getnframes())
-        data_queue = asyncio.Queue[bytes]()
-        while data:
-            chunk = data[:chunk_size]
-            data = data[chunk_size:]
-            asyncio.run_coroutine_threadsafe(
-                data_queue.put(chunk), asyncio.get_event_loop()
-            )
-        LOGGER.debug(f"Loaded audio file: {filename}")
-
-    async def player():
-        nonlocal data_queue
-        return await data_queue.get()
-
-    cancellation_handler = EventHandler(data_queue.join, one_shot=True)
-
-    return player, config, cancellation_handler
+    mic = FileMicrophone(filename, chunk_size, realtime, loop)
+    mic.seek(start)
+    cancellation_handler = EventHandler(mic.close, one_shot=True)
+    return mic.read, mic.config, cancellation_handler
 
 
 async def create_websocket_mic(websocket: WebSocketConnection):
     """Creates a websocket microphone that returns audio chunks from a
     websocket.
 
+    Received WebM audio is decoded by an ffmpeg process that is fed and
+    drained independently, so decoding is not lock-stepped with receiving.
+    Raw PCM audio is used as is, without a decoding process.
+
     Args:
         websocket (WebSocketConnection): The websocket to read from.
 
     Returns:
-        Callable[[], Coroutine[bytes]]: The audio source.
+        Callable[[], Coroutine[bytes]]: The audio source, returning chunks of
+            `chunk_size` frames.
         MicrophoneConfig: The audio configuration.
         EventHandler: The cancellation handler.
+
+    Raises:
+        DecoderLimitError: If the audio needs decoding while `MAX_DECODERS`
+            decoding processes are already running.
+        AudioDecodingError: If the decoding process fails or stalls while
+            reading audio.
     """
+    global _decoders
 
     await websocket.connect()
 
@@ -79,56 +103,53 @@ async def create_websocket_mic(websocket: WebSocketConnection):
     assert config.sample_width == 2  # only supported sample width
     assert config.num_channels == 1  # only supported number of channels
     LOGGER.debug(f"Received microphone config: {config}")
+    if config.encoding == "pcm":
+        return _create_pcm_mic(websocket, config)
+    assert config.encoding == "webm"  # only supported encodings
+    if _decoders >= MAX_DECODERS:
+        await websocket.disconnect(
+            status.WS_1013_TRY_AGAIN_LATER, "Too many audio decoders"
+        )
+        raise DecoderLimitError(f"{_decoders} decoders already running")
 
-    # audio stream decoding process
-    process = await asyncio.create_subprocess_exec(
-        "ffmpeg",
-        "-i",
-        "pipe:0",
-        "-f",
-        "s16le",
-        "-ar",
-        str(config.sample_rate),
-        "-ac",
-        str(config.num_channels),
-        "pipe:1",
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
+    # audio stream decoding process, counted before it's spawned
+    _decoders += 1
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-i",
+            "pipe:0",
+            "-f",
+            "s16le",
+            "-ar",
+            str(config.sample_rate),
+            "-ac",
+            str(config.num_channels),
+            "pipe:1",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except BaseException:
+        _decoders -= 1
+        raise
+    decoder = _StreamDecoder(
+        process, config.chunk_size * config.sample_width * config.num_channels
     )
+    decoder.start(websocket.receive_bytes)
 
     async def receive_audio():
-        nonlocal websocket, process
-        try:
-            audio_bytes = await websocket.receive_bytes()
-        except WebSocketDisconnect as e:
-            raise asyncio.CancelledError from e
-        if not audio_bytes:
-            return b""
-
-        # ensure process pipes are still open
-        if not process.stdout or not process.stdin:
-            raise WebSocketException(
-                reason="Audio decoding process terminated unexpectedly",
-                code=status.WS_1011_INTERNAL_ERROR,
-            )
-
         try:
-            # decode audio data from webm to wav
-            process.stdin.write(audio_bytes)
-            await process.stdin.drain()
-
-            # read decoded audio data
-            audio_bytes = await asyncio.wait_for(process.stdout.read(10**8), 1)
-            return audio_bytes
-        except (BrokenPipeError, asyncio.CancelledError):
-            return b""
-        except asyncio.TimeoutError:
-            LOGGER.error("Audio decoding process timed out")
-            return b""
+            return await decoder.read()
+        except AudioDecodingError as e:
+            LOGGER.error("Audio decoding failed: %s", e)
+            await websocket.disconnect()  # end the audio session
+            raise
 
     async def shutdown():
-        nonlocal websocket, process
+        global _decoders
+        _decoders -= 1
+        await decoder.stop()
         process.terminate()  # terminate the ffmpeg process
         await asyncio.sleep(0.5)  # time for resources to clean up
         process.kill()
@@ -137,3 +158,297 @@ async def create_websocket_mic(websocket: WebSocketConnection):
 
     cancellation_handler = EventHandler(shutdown, one_shot=True)
     return receive_audio, config, cancellation_handler
+
+
+def _create_pcm_mic(websocket: WebSocketConnection, config: MicrophoneConfig):
+    # create a microphone receiving raw PCM frames, bypassing decoding
+    frame_size = config.sample_width * config.num_channels
+    next_sequence: int | None = None  # expected sequence number
+    dropped_frames = 0  # number of frames missing from the stream
+
+    async def receive_audio():
+        nonlocal next_sequence, dropped_frames
+        try:
+            packet = await websocket.receive_bytes()
+        except WebSocketDisconnect as e:
+            raise asyncio.CancelledError from e
+        if len(packet) <= _pcm_header.size:
+            return b""
+
+        sequence, _ = _pcm_header.unpack_from(packet)
+        audio = packet[_pcm_header.size :]
+        gap = sequence - next_sequence if next_sequence is not None else 0
+        next_sequence = sequence + 1
+        if gap <= 0:
+            return audio
+
+        # replace missing frames with silence to preserve the timeline
+        dropped_frames += gap
+        LOGGER.warning("Microphone dropped %d PCM frames", gap)
+        max_gap = int(MAX_FRAME_GAP * config.sample_rate) * frame_size
+        return bytes(min(gap * len(audio), max_gap)) + audio
+
+    async def shutdown():
+        if dropped_frames:
+            LOGGER.info("Microphone dropped %d PCM frames", dropped_frames)
+        LOGGER.debug("PCM microphone stopped")
+
+    cancellation_handler = EventHandler(shutdown, one_shot=True)
+    return receive_audio, config, cancellation_handler
+
+
+class _StreamDecoder:
+    """A full-duplex decoder. One task feeds received audio to the decoding
+    process while another continuously drains its decoded PCM output into a
+    buffer, from which fixed-size chunks are read."""
+
+    def __init__(self, process: asyncio.subprocess.Process, chunk_size: int):
+        assert process.stdin and process.stdout, "Decoder pipes not open"
+        self._process = process
+        self._chunk_size = chunk_size  # size of read chunks (bytes)
+        self._pcm = bytearray()  # decoded audio not read yet
+        self._available = asyncio.Condition()  # notified on decoder output
+        self._tasks: list[asyncio.Task] = []
+
+        self._disconnected = False  # whether the audio source disconnected
+        self._drained = False  # whether the decoder output was closed
+        self._error: Exception | None = None  # the decoding error, if any
+        self._pending_input = False  # whether input awaits decoding
+        self._output_time = 0.0  # last time audio was decoded
+
+    def start(self, receiver: Callable[[], Coroutine[None, None, bytes]]):
+        """Start decoding audio received from a source."""
+        self._output_time = asyncio.get_running_loop().time()
+        self._tasks = [
+            asyncio.create_task(self._feed(receiver)),
+            asyncio.create_task(self._drain()),
+        ]
+
+    async def read(self) -> bytes:
+        """Read a chunk of decoded audio, waiting until it is available.
+
+        Raises:
+            asyncio.CancelledError: If the audio source disconnected and all
+                decoded audio was read.
+            AudioDecodingError: If the decoder failed or stalled.
+        """
+        async with self._available:
+            while len(self._pcm) < self._chunk_size:
+                if self._error:
+                    raise self._error
+                if self._drained:  # all audio of the source was read
+                    raise asyncio.CancelledError
+                try:
+                    await asyncio.wait_for(
+                        self._available.wait(), DECODER_STALL_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    self._check_stall()
+
+            chunk = bytes(self._pcm[: self._chunk_size])
+            del self._pcm[: self._chunk_size]
+            return chunk
+
+    async def stop(self):
+        """Stop feeding and draining the decoder."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _feed(self, receiver):
+        stdin = self._process.stdin
+        assert stdin is not None
+        try:
+            while True:
+                audio_bytes = await receiver()
+                if not audio_bytes:
+                    continue
+                stdin.write(audio_bytes)
+                self._pending_input = True
+                await stdin.drain()
+        except WebSocketDisconnect:
+            stdin.close()  # flush remaining audio out of the decoder
+            await self._notify(disconnected=True)
+        except (BrokenPipeError, ConnectionResetError):
+            await self._notify(
+                AudioDecodingError("Audio decoding process closed its input")
+            )
+        except Exception as e:  # failed to receive audio
+            stdin.close()
+            error = AudioDecodingError(f"Failed to feed audio decoder: {e}")
+            error.__cause__ = e
+            await self._notify(error)
+
+    async def _drain(self):
+        stdout = self._process.stdout
+        assert stdout is not None
+        while data := await stdout.read(DECODER_READ_SIZE):
+            async with self._available:
+                self._pcm += data
+                self._pending_input = False
+                self._output_time = asyncio.get_running_loop().time()
+                self._available.notify_all()
+
+        # decoder output closed
+        error = None
+        if not self._disconnected:  # decoder exited while receiving audio
+            return_code = await self._process.wait()
+            error = AudioDecodingError(
+                f"Audio decoding process exited with code {return_code}"
+            )
+        await self._notify(error, drained=True)
+
+    def _check_stall(self):
+        now = asyncio.get_running_loop().time()
+        if self._pending_input and now - self._output_time > (
+            DECODER_STALL_TIMEOUT
+        ):  # input was received but nothing was decoded
+            self._error = AudioDecodingError(
+                f"Audio decoding stalled for {DECODER_STALL_TIMEOUT} seconds"
+            )
+            raise self._error
+
+    async def _notify(
+        self,
+        error: Exception | None = None,
+        disconnected: bool = False,
+        drained: bool = False,
+    ):
+        async with self._available:
+            self._error = self._error or error
+            self._disconnected = self._disconnected or disconnected
+            self._drained = self._drained or drained
+            self._available.notify_all()
+
+
+class FileMicrophone:
+    """A microphone streaming the audio of a WAV file. The file's audio data
+    is memory-mapped and returned as zero-copy `memoryview` chunks, so files
+    of any length are streamed at a constant cost per chunk, and only the
+    pages being read are loaded into memory.
+
+    Returned chunks are views of the mapped file, valid until the microphone
+    is closed; consumers that keep audio must copy it.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        chunk_size: int = 1024,
+        realtime: bool = False,
+        loop: bool = False,
+    ):
+        """
+        Args:
+            filename (str): The WAV file to read from.
+            chunk_size (int, optional): The number of frames per chunk.
+                Defaults to 1024.
+            realtime (bool, optional): Whether chunks are returned at the pace
+                of the audio. Defaults to False.
+            loop (bool, optional): Whether the file is replayed from its start
+                when it ends. Defaults to False.
+
+        Raises:
+            wave.Error: If the file is not a PCM WAV file.
+        """
+        filename = os.path.abspath(os.path.expanduser(filename))
+        with wave.open(filename, "rb") as file:  # validate the format
+            self.config = MicrophoneConfig(
+                sample_rate=file.getframerate(),
+                chunk_size=chunk_size,
+                sample_width=file.getsampwidth(),
+                num_channels=file.getnchannels(),
+            )
+            """The audio configuration of the file."""
+        self.realtime = realtime
+        """Whether chunks are returned at the pace of the audio."""
+        self.loop = loop
+        """Whether the file is replayed from its start when it ends."""
+
+        with open(filename, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):  # read ahead aggressively
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._frame_size = self.config.sample_width * self.config.num_channels
+        self._chunk_bytes = chunk_size * self._frame_size
+        self._data = self._map_data()  # the audio data of the file
+        self._position = 0  # offset of the next chunk in the data (bytes)
+        self._due = 0.0  # time the next chunk is due, if paced
+        LOGGER.debug(f"Opened audio file: {filename}")
+
+    @property
+    def duration(self) -> float:
+        """The duration of the file's audio (seconds)."""
+        return len(self._data) / self._frame_size / self.config.sample_rate
+
+    @property
+    def position(self) -> float:
+        """The time of the next chunk in the file (seconds)."""
+        return self._position / self._frame_size / self.config.sample_rate
+
+    def seek(self, position: float):
+        """Move to a time in the file, clamped to the file's duration.
+
+        Args:
+            position (float): The time to read from next (seconds).
+        """
+        frame = round(position * self.config.sample_rate)
+        offset = frame * self._frame_size
+        self._position = min(max(offset, 0), len(self._data))
+        self._due = 0.0  # restart pacing from the new position
+
+    async def read(self) -> memoryview:
+        """Read the next chunk of audio, waiting until it's due if paced.
+
+        Raises:
+            asyncio.CancelledError: If the file ended and isn't looped.
+        """
+        if self._position >= len(self._data):
+            if not self.loop or not self._data:
+                raise asyncio.CancelledError  # end of file
+            self._position = 0
+
+        start = self._position
+        chunk = self._data[start : start + self._chunk_bytes]
+        self._position += len(chunk)
+        if self.realtime:  # don't catch up on time lost by the consumer
+            now = time.monotonic()
+            self._due = max(self._due, now)
+            await asyncio.sleep(self._due - now)
+            frames = len(chunk) // self._frame_size
+            self._due += frames / self.config.sample_rate
+        return chunk
+
+    def close(self):
+        """Release the file. Chunks must not be used afterwards."""
+        self._data.release()
+        try:
+            self._map.close()
+        except BufferError:  # chunks are still referenced
+            LOGGER.debug("Audio file still in use, unmapped when collected")
+
+    def _map_data(self) -> memoryview:
+        # find the data chunk of the RIFF file
+        view = memoryview(self._map)
+        offset = 12  # skip the RIFF header
+        while offset + _riff_chunk.size <= len(view):
+            chunk_id, size = _riff_chunk.unpack_from(view, offset)
+            offset += _riff_chunk.size
+            if chunk_id == b"data":  # data may be truncated or still written
+                size = min(size, len(view) - offset)
+                size -= size % self._frame_size
+                return view[offset : offset + size]
+            offset += size + size % 2  # chunks are word-aligned
+        raise wave.Error("WAV file has no data chunk")
+
+
+class AudioDecodingError(Exception):
+    """An error raised when decoding microphone audio fails."""
+
+    ...
+
+
+class DecoderLimitError(AudioDecodingError):
+    """An error raised when no more audio can be decoded at a time."""
+
+    ...
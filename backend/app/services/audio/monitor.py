@@ -0,0 +1,221 @@
+"""
+Audio monitor service.
+
+Lets listeners hear the audio of a microphone remotely. Every audio
+chunk is encoded once per codec, regardless of the number of listeners, and
+the encoded audio is fanned out to the listeners through broadcast hubs. Each
+listener has a bounded queue from which the oldest audio is dropped when the
+listener falls behind, and the monitor itself subscribes to the microphone
+with a bounded queue, so listeners never slow down the speaker or the
+transcription of the microphone.
+
+Codecs:
+
+- `pcm`: Mono 16-bit little-endian PCM at `MONITOR_SAMPLE_RATE`, one message
+  per chunk.
+- `opus`: Mono Ogg/Opus encoded by ffmpeg, one message per Ogg page. The
+  stream's header pages are sent first to listeners that join mid-stream.
+
+Listeners are first sent a JSON message describing the audio.
+"""
+
+import asyncio
+import struct
+import subprocess
+
+import numpy as np
+
+from ...models.microphone import MicrophoneConfig
+from ..broadcast import BroadcastHub
+from ..events import Event, EventHandler, OverflowPolicy
+from ..websocket import WebSocketConnection
+from . import LOGGER
+
+MONITOR_SAMPLE_RATE = 16000
+"""The sample rate of monitored audio."""
+OPUS_BITRATE = "32k"
+"""The bitrate of monitored Opus audio."""
+MAX_QUEUED_CHUNKS = 50
+"""The maximum number of audio chunks queued to a listener, or waiting to be
+encoded, before the oldest are dropped."""
+CODECS = ("pcm", "opus")
+"""The supported codecs of monitored audio."""
+
+_ogg_page = struct.Struct("<4sBBqIIIB")  # ogg page header, without segments
+
+
+class AudioMonitor:
+    """Monitors the audio of a microphone for remote listeners."""
+
+    def __init__(self):
+        self._hubs = {
+            codec: BroadcastHub(
+                f"Audio monitor ({codec})", MAX_QUEUED_CHUNKS, evict_slow=False
+            )
+            for codec in CODECS
+        }
+        self._source: Event[bytes] | None = None
+        self._handler: EventHandler | None = None
+        self._resampler: _Resampler | None = None
+        self._encoder: _OpusEncoder | None = None
+
+    async def attach(self, mic_config: MicrophoneConfig, audio: Event[bytes]):
+        """Start monitoring the audio of a microphone, replacing the
+        monitored microphone, if any.
+
+        Args:
+            mic_config (MicrophoneConfig): The microphone configuration.
+            audio (Event[bytes]): The audio event of the microphone.
+        """
+        await self.detach()
+        self._resampler = _Resampler(mic_config, MONITOR_SAMPLE_RATE)
+        self._encoder = _OpusEncoder(self._hubs["opus"])
+        self._handler = EventHandler(
+            self._process,
+            sequential=True,
+            timeout=None,
+            max_queue_size=MAX_QUEUED_CHUNKS,
+            overflow_policy=OverflowPolicy.DROP_OLDEST,
+        )
+        self._source = audio
+        await audio.subscribe(self._handler)
+        LOGGER.debug("Audio monitor attached")
+
+    async def detach(self):
+        """Stop monitoring the microphone."""
+        if self._source is None or self._handler is None:
+            return
+        await self._source.unsubscribe(self._handler)
+        if self._encoder is not None:
+            await self._encoder.close()
+        self._source = self._handler = self._encoder = None
+        LOGGER.debug("Audio monitor detached")
+
+    async def listen(self, socket: WebSocketConnection, codec: str):
+        """Send the monitored audio to a listener until it disconnects.
+
+        Args:
+            socket (WebSocketConnection): The listener's connection.
+            codec (str): The codec of the audio sent to the listener.
+        """
+        await socket.send(
+            {
+                "codec": codec,
+                "sample_rate": MONITOR_SAMPLE_RATE,
+                "num_channels": 1,
+            }
+        )
+        if codec == "opus" and self._encoder is not None:
+            for page in self._encoder.header:
+                await socket.send(page)
+        await self._hubs[codec].serve(socket)
+
+    def stats(self) -> dict:
+        """The statistics of the monitor's listeners, by codec."""
+        return {codec: hub.stats() for codec, hub in self._hubs.items()}
+
+    async def _process(self, data: bytes):
+        pcm_hub, opus_hub = self._hubs["pcm"], self._hubs["opus"]
+        if not (pcm_hub.clients or opus_hub.clients):
+            return  # nobody is listening
+        assert self._resampler is not None and self._encoder is not None
+
+        audio = self._resampler.process(data).tobytes()
+        if pcm_hub.clients:
+            pcm_hub.publish(audio)
+        if opus_hub.clients:
+            await self._encoder.write(audio)
+
+
+class _Resampler:
+    """Converts audio to mono 16-bit audio at another sample rate, using
+    linear interpolation that continues across chunks."""
+
+    def __init__(self, mic_config: MicrophoneConfig, rate: int):
+        self._channels = mic_config.num_channels
+        self._sample_type = np.dtype(f"<i{mic_config.sample_width}")
+        self._scale = 2.0 ** (16 - 8 * mic_config.sample_width)  # to 16-bit
+        self._step = mic_config.sample_rate / rate  # input samples per output
+        self._position = 0.0  # position of the next output in the pending
+        self._pending = np.zeros(0, np.float32)  # unused input samples
+
+    def process(self, data: bytes) -> np.ndarray:
+        samples = np.frombuffer(data, self._sample_type)
+        mono = samples.reshape(-1, self._channels).mean(1, dtype=np.float32)
+        samples = np.concatenate((self._pending, mono * self._scale))
+
+        if len(samples) - 1 < self._position:  # not enough for an output
+            self._pending = samples
+            return np.zeros(0, np.int16)
+        count = int((len(samples) - 1 - self._position) / self._step) + 1
+        positions = self._position + np.arange(count) * self._step
+        output = np.interp(positions, np.arange(len(samples)), samples)
+
+        # keep the samples needed by the next outputs
+        next_position = self._position + count * self._step
+        keep = min(int(next_position), len(samples))
+        self._pending = samples[keep:]
+        self._position = next_position - keep
+        return np.clip(output, -32768, 32767).astype("<i2")
+
+
+class _OpusEncoder:
+    """Encodes mono 16-bit PCM audio to Ogg/Opus using ffmpeg, publishing
+    each Ogg page. The encoder is started when audio is first written."""
+
+    def __init__(self, hub: BroadcastHub):
+        self.header: list[bytes] = []
+        """The header pages of the stream (identification and comments)."""
+        self._hub = hub
+        self._process: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+
+    async def write(self, audio: bytes):
+        if self._process is None:
+            self._process = await asyncio.create_subprocess_exec(
+                *["ffmpeg", "-hide_banner", "-loglevel", "error"],
+                *["-f", "s16le", "-ar", str(MONITOR_SAMPLE_RATE), "-ac", "1"],
+                *["-i", "pipe:0", "-c:a", "libopus", "-b:a", OPUS_BITRATE],
+                *["-application", "voip", "-frame_duration", "20"],
+                *["-page_duration", "20000", "-flush_packets", "1"],
+                *["-f", "ogg", "pipe:1"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            self._reader = asyncio.create_task(self._read_pages())
+
+        assert self._process.stdin is not None
+        try:
+            self._process.stdin.write(audio)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            LOGGER.error("Audio monitor encoder stopped")
+            await self.close()
+
+    async def close(self):
+        if self._process is None:
+            return
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        self._process = self._reader = None
+        self.header = []
+
+    async def _read_pages(self):
+        assert self._process is not None and self._process.stdout
+        stdout = self._process.stdout
+        try:
+            while True:
+                header = await stdout.readexactly(_ogg_page.size)
+                segments = await stdout.readexactly(header[-1])
+                body = await stdout.readexactly(sum(segments))
+                page = header + segments + body
+
+                granule = _ogg_page.unpack(header)[3]
+                if granule == 0 and len(self.header) < 2:
+                    self.header.append(page)  # for listeners joining later
+                self._hub.publish(page)
+        except asyncio.IncompleteReadError:
+            pass  # the encoder stopped
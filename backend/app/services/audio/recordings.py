@@ -0,0 +1,205 @@
+"""
+Audio recordings.
+
+Provides a writer that streams audio to files as it is received, at a
+constant cost per chunk of audio.
+"""
+
+import os
+import struct
+import subprocess
+from collections.abc import Callable
+from typing import BinaryIO
+
+from ...models.microphone import MicrophoneConfig
+from . import LOGGER
+
+HEADER_UPDATE_INTERVAL = 5
+"""The duration of audio written between updates of the sizes in a WAV file's
+header (seconds). Keeps interrupted recordings readable."""
+MAX_WAV_SIZE = 2**32 - 1 - 44
+"""The maximum size of the audio data of a WAV file (bytes)."""
+CODECS = ("wav", "flac")
+"""The supported recording codecs."""
+
+_wav_header = struct.Struct("<4sI4s4sIHHIIHH4sI")
+WAV_HEADER_SIZE = _wav_header.size
+"""The size of the header of WAV files written by the service (bytes)."""
+
+
+def wav_header(mic_config: MicrophoneConfig, data_size: int) -> bytes:
+    """Create the header of a PCM WAV file.
+
+    Args:
+        mic_config (MicrophoneConfig): The configuration of the audio.
+        data_size (int): The size of the audio data of the file (bytes).
+
+    Returns:
+        bytes: The header, followed by the audio data in the file.
+    """
+    frame_size = mic_config.sample_width * mic_config.num_channels
+    return _wav_header.pack(
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,  # fmt chunk size
+        1,  # PCM format
+        mic_config.num_channels,
+        mic_config.sample_rate,
+        mic_config.sample_rate * frame_size,
+        frame_size,
+        mic_config.sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+class AudioFileWriter:
+    """Writes audio to a file as it is received. WAV files are appended to and
+    their header is patched periodically and on close. FLAC files are encoded
+    by an ffmpeg process. Recordings are split into segment files when they
+    reach a maximum size or duration; segments after the first are suffixed
+    with their index (e.g. `recording.1.wav`).
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        mic_config: MicrophoneConfig,
+        codec: str = "wav",
+        max_segment_duration: float | None = None,
+        max_segment_size: int | None = None,
+        on_segment: Callable[[str, int], None] | None = None,
+    ):
+        """
+        Args:
+            file_path (str): The path of the first segment file.
+            mic_config (MicrophoneConfig): The configuration of the audio.
+            codec (str, optional): The codec of the files, `wav` or `flac`.
+                Defaults to `wav`.
+            max_segment_duration (float, optional): The maximum duration of a
+                segment (seconds). Defaults to no limit.
+            max_segment_size (int, optional): The maximum size of the audio
+                data of a segment (bytes). Defaults to no limit.
+            on_segment (Callable[[str, int], None], optional): Called with
+                the path of every segment file when it's created, and the
+                index of its first frame in the recording.
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Invalid recording codec: {codec}")
+
+        self.codec = codec
+        """The codec of the recording."""
+        self.segments: list[str] = []
+        """The paths of the recording's segment files."""
+        self.frames = 0
+        """The number of frames written to the recording."""
+
+        self._path, _ = os.path.splitext(os.path.abspath(file_path))
+        self._config = mic_config
+        self._on_segment = on_segment
+        self._pcm_format = (  # ffmpeg's raw audio format
+            "u8"
+            if mic_config.sample_width == 1
+            else f"s{mic_config.sample_width * 8}le"
+        )
+        self._frame_size = mic_config.sample_width * mic_config.num_channels
+        byte_rate = mic_config.sample_rate * self._frame_size
+
+        # segment limits, aligned to whole frames
+        limits = [MAX_WAV_SIZE] if codec == "wav" else []
+        if max_segment_size:
+            limits.append(max_segment_size)
+        if max_segment_duration:
+            limits.append(int(max_segment_duration * byte_rate))
+        self._segment_limit = min(limits) if limits else None
+        if self._segment_limit:
+            self._segment_limit -= self._segment_limit % self._frame_size
+        self._header_interval = HEADER_UPDATE_INTERVAL * byte_rate
+
+        self._file: BinaryIO | None = None  # the open WAV file
+        self._process: subprocess.Popen | None = None  # the FLAC encoder
+        self._size = 0  # size of the audio data of the current segment
+        self._header_size = 0  # data size written to the header
+
+    def write(self, data: bytes):
+        """Append audio to the recording."""
+        data = memoryview(data)
+        while data:
+            if self._file is None and self._process is None:
+                self._open_segment()
+
+            size = len(data)
+            if self._segment_limit:
+                size = min(size, self._segment_limit - self._size)
+            self._write(data[:size])
+            data = data[size:]
+
+            if self._size == self._segment_limit:
+                self._close_segment()
+
+    def close(self):
+        """Finish the recording."""
+        self._close_segment()
+
+    def _open_segment(self):
+        index = len(self.segments)
+        path = f"{self._path}{f'.{index}' if index else ''}.{self.codec}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._size = self._header_size = 0
+
+        if self.codec == "wav":
+            self._file = open(path, "wb")
+            self._file.write(wav_header(self._config, 0))
+        else:
+            self._process = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-y",
+                    *("-f", self._pcm_format),
+                    *("-ar", str(self._config.sample_rate)),
+                    *("-ac", str(self._config.num_channels)),
+                    *("-i", "pipe:0"),
+                    *("-c:a", "flac"),
+                    path,
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        self.segments.append(path)
+        LOGGER.debug("Recording audio to: %s", path)
+        if self._on_segment is not None:
+            self._on_segment(path, self.frames)
+
+    def _write(self, data: memoryview):
+        if self._file is not None:
+            self._file.write(data)
+            self._size += len(data)
+            if self._size - self._header_size >= self._header_interval:
+                self._update_header()
+        elif self._process is not None and self._process.stdin:
+            self._process.stdin.write(data)
+            self._size += len(data)
+        self.frames += len(data) // self._frame_size
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._update_header()
+            self._file.close()
+            self._file = None
+        if self._process is not None:
+            if self._process.stdin:
+                self._process.stdin.close()
+            if self._process.wait() != 0:
+                LOGGER.error("Failed to encode: %s", self.segments[-1])
+            self._process = None
+
+    def _update_header(self):
+        assert self._file is not None
+        self._file.seek(0)
+        self._file.write(wav_header(self._config, self._size))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+        self._header_size = self._size
@@ -5,7 +5,8 @@ Provides an interface for playing audio to a speaker. It uses the events
 service to listen to audio data and play it.
 """
 
-import wave
+import asyncio
+import time
 
 import pyaudio  # type: ignore
 
@@ -14,13 +15,33 @@ from ...models.microphone import MicrophoneConfig
 from ..configurator import config, register_validator
 from ..events import Event, EventHandler
 from . import LOGGER
+from .buffers import ClipMixer, JitterBuffer
+from .recordings import AudioFileWriter
 
 LOCAL_AUDIO_SOURCE = pyaudio.PyAudio()
 """The local audio source."""
+PLAYOUT_DELAY = 0.08
+"""The minimum delay between receiving audio and playing it (seconds). The
+delay grows up to `MAX_PLAYOUT_DELAY` when audio arrives with more jitter."""
+MAX_PLAYOUT_DELAY = 0.5
+"""The maximum delay between receiving audio and playing it (seconds). Older
+audio is dropped when exceeded to keep the speaker close to real time."""
+PLAYBACK_PERIOD = 0.01
+"""The duration of audio requested by the speaker at a time (seconds)."""
+CLIP_SPEAKER_TIMEOUT = 5
+"""The idle time after which a speaker started only to play clips is stopped
+(seconds)."""
+
+_clip_outputs: list[tuple[ClipMixer, MicrophoneConfig]] = []
+# the clip mixers of running speakers and their audio format, newest last
+_tasks: set[asyncio.Task] = set()  # running clip speakers
 
 
 async def start_speaker(mic_config: MicrophoneConfig, mic_event: Event[bytes]):
-    """Start a speaker.
+    """Start a speaker. Audio is played from a jitter buffer by the audio
+    device's callback, so playback is not blocked by bursts of audio. Clips
+    are mixed into the playback while the speaker is the newest running one
+    (see `get_clip_output`).
 
     Args:
         mic_config (MicrophoneConfig): The microphone configuration.
@@ -34,6 +55,27 @@ async def start_speaker(mic_config: MicrophoneConfig, mic_event: Event[bytes]):
     """
     global config
 
+    jitter_buffer = JitterBuffer(
+        mic_config.sample_rate,
+        mic_config.sample_width,
+        mic_config.num_channels,
+        PLAYOUT_DELAY,
+        MAX_PLAYOUT_DELAY,
+    )
+
+    byte_rate = (
+        mic_config.sample_rate
+        * mic_config.sample_width
+        * mic_config.num_channels
+    )
+
+    mixer = ClipMixer(mic_config.sample_width)
+    clip_output = (mixer, mic_config)
+
+    def play_audio(_, frame_count: int, __, ___):
+        audio = mixer.mix(jitter_buffer.read(frame_count))
+        return audio, pyaudio.paContinue
+
     stream = LOCAL_AUDIO_SOURCE.open(
         format=LOCAL_AUDIO_SOURCE.get_format_from_width(
             mic_config.sample_width
@@ -42,23 +84,34 @@ async def start_speaker(mic_config: MicrophoneConfig, mic_event: Event[bytes]):
         rate=mic_config.sample_rate,
         output=True,
         output_device_index=config.audio_device,
+        frames_per_buffer=int(mic_config.sample_rate * PLAYBACK_PERIOD),
+        stream_callback=play_audio,
     )
 
-    def write_audio(data: bytes):
-        try:
-            stream.write(data)
-        except OSError:
-            pass  # disconnected
+    async def write_audio(data: bytes):
+        jitter_buffer.write(data)
 
     # start listening to microphone
-    handler = EventHandler(write_audio, sequential=True, timeout=2.5)
+    handler = EventHandler(write_audio, blocking=True, timeout=None)
     await mic_event.subscribe(handler)
+    _clip_outputs.append(clip_output)
 
     async def stop_speaker():
         try:
+            _clip_outputs.remove(clip_output)
             await mic_event.unsubscribe(handler)
             stream.stop_stream()
             stream.close()
+            LOGGER.info(
+                "Speaker playback: %d underruns, %d overruns, "
+                "%.2fs of silence trimmed, %.2fs of audio dropped, "
+                "%.0fms target delay",
+                jitter_buffer.underruns,
+                jitter_buffer.overruns,
+                jitter_buffer.trimmed_bytes / byte_rate,
+                jitter_buffer.dropped_bytes / byte_rate,
+                jitter_buffer.target_delay * 1000,
+            )
         except Exception as e:
             LOGGER.error(f"Exception stopping speaker: {e}")
         finally:
@@ -72,37 +125,45 @@ async def start_speaker(mic_config: MicrophoneConfig, mic_event: Event[bytes]):
 
 
 async def start_file_speaker(
-    mic_config: MicrophoneConfig, mic_event: Event[bytes], file_path: str
+    mic_config: MicrophoneConfig,
+    mic_event: Event[bytes],
+    file_path: str,
+    codec: str = "wav",
+    max_segment_duration: float | None = None,
+    max_segment_size: int | None = None,
 ):
-    """Start a speaker that writes audio to a file.
+    """Start a speaker that writes audio to a file. Audio is appended to the
+    file as it is received, and the recording is split into segment files at
+    the given limits.
 
     Args:
         mic_config (MicrophoneConfig): The microphone configuration.
         mic_event (Event[bytes]): The audio event triggered on new microphone
             data.
         file_path (str): The file path to write audio data to.
+        codec (str, optional): The codec of the file, `wav` or `flac`.
+            Defaults to `wav`.
+        max_segment_duration (float, optional): The maximum duration of a
+            segment file (seconds). Defaults to no limit.
+        max_segment_size (int, optional): The maximum size of a segment file
+            (bytes). Defaults to no limit.
 
     Returns:
         Tuple[Event[bytes], MicrophoneConfig, CancellationToken]: The audio
             cancellation token to stop listening.
     """
-    buffer = bytes()
-
-    async def write_audio(data: bytes):
-        nonlocal buffer
-        buffer += data
-        with wave.open(file_path, "wb") as f:
-            f.setnchannels(mic_config.num_channels)
-            f.setsampwidth(mic_config.sample_width)
-            f.setframerate(mic_config.sample_rate)
-            f.writeframes(buffer)
+    writer = AudioFileWriter(
+        file_path, mic_config, codec, max_segment_duration, max_segment_size
+    )
 
     # start listening to microphone
-    handler = EventHandler(write_audio)
+    handler = EventHandler(writer.write, threaded=True)
     await mic_event.subscribe(handler)
 
     async def stop_speaker():
         await mic_event.unsubscribe(handler)
+        await asyncio.to_thread(handler.close, True)  # write queued audio
+        await asyncio.to_thread(writer.close)
         LOGGER.debug("Speaker stopped")
 
     # create cancellation token
@@ -112,6 +173,80 @@ async def start_file_speaker(
     return cancellation_event
 
 
+def get_clip_format() -> MicrophoneConfig:
+    """Get the audio format of the clip output returned by `get_clip_output`,
+    without starting a speaker.
+
+    Returns:
+        MicrophoneConfig: The audio format of the clip output's playback.
+    """
+    if (clip_output := _active_clip_output()) is not None:
+        return clip_output[1]
+    device = LOCAL_AUDIO_SOURCE.get_device_info_by_index(config.audio_device)
+    return MicrophoneConfig(int(device["defaultSampleRate"]), 2)
+
+
+async def get_clip_output() -> tuple[ClipMixer, MicrophoneConfig]:
+    """Get the clip mixer of the active speaker, the newest running one that
+    can mix clips. If no such speaker is running, a speaker playing only
+    clips is started at the audio device's sample rate, which stops once no
+    clips were played for `CLIP_SPEAKER_TIMEOUT`.
+
+    Returns:
+        Tuple[ClipMixer, MicrophoneConfig]: The mixer and the audio format of
+            the speaker's playback.
+    """
+    if (clip_output := _active_clip_output()) is not None:
+        return clip_output
+
+    mic_config = get_clip_format()
+    mixer = ClipMixer(mic_config.sample_width)
+    frame_size = mic_config.sample_width * mic_config.num_channels
+
+    def play_clips(_, frame_count: int, __, ___):
+        audio = mixer.mix(bytes(frame_count * frame_size))
+        return audio, pyaudio.paContinue
+
+    stream = LOCAL_AUDIO_SOURCE.open(
+        format=LOCAL_AUDIO_SOURCE.get_format_from_width(
+            mic_config.sample_width
+        ),
+        channels=mic_config.num_channels,
+        rate=mic_config.sample_rate,
+        output=True,
+        output_device_index=config.audio_device,
+        frames_per_buffer=int(mic_config.sample_rate * PLAYBACK_PERIOD),
+        stream_callback=play_clips,
+    )
+    clip_output = (mixer, mic_config)
+    _clip_outputs.insert(0, clip_output)  # speakers started later take over
+    LOGGER.debug("Clip speaker started")
+
+    async def stop_when_idle():
+        idle_since = time.monotonic()
+        while time.monotonic() - idle_since < CLIP_SPEAKER_TIMEOUT:
+            await asyncio.sleep(PLAYBACK_PERIOD * 10)
+            if mixer.playing:
+                idle_since = time.monotonic()
+        _clip_outputs.remove(clip_output)
+        stream.stop_stream()
+        stream.close()
+        LOGGER.debug("Clip speaker stopped")
+
+    task = asyncio.create_task(stop_when_idle())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return clip_output
+
+
+def _active_clip_output() -> tuple[ClipMixer, MicrophoneConfig] | None:
+    # the newest running speaker that can mix clips
+    for clip_output in reversed(_clip_outputs):
+        if clip_output[0].enabled:
+            return clip_output
+    return None
+
+
 # CONFIGURATION ###############################################################
 
 
@@ -0,0 +1,262 @@
+"""
+Broadcast service. Fans messages out to many WebSocket and server-sent events
+clients.
+
+Each message is serialized once and queued to every client's bounded outbox.
+Every client is sent its messages by its own task, so clients are sent to
+concurrently and a slow client only fills its own outbox. Clients whose
+outbox overflows are either disconnected (evicted) or lose their oldest
+queued messages, depending on the hub.
+
+Liveness of clients is not polled: a hub waits on the clients' connections
+for their disconnection, and dead connections are detected by the server's
+WebSocket ping/pong (see `startup.py`).
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from typing import Any
+
+from fastapi import WebSocketDisconnect
+
+from .websocket import WebSocketConnection
+
+LOGGER = logging.getLogger(__name__)
+"""Broadcast service logger."""
+MAX_OUTBOX = 64
+"""The default maximum number of messages queued to a client."""
+HISTORY_SIZE = 256
+"""The default number of recent events kept by event streams."""
+KEEP_ALIVE_INTERVAL = 15
+"""The default interval of keep-alive comments of idle event streams
+(seconds)."""
+RETRY_INTERVAL = 2000
+"""The reconnection delay of event stream clients (milliseconds)."""
+
+
+class BroadcastHub:
+    """A hub broadcasting messages to WebSocket clients."""
+
+    def __init__(
+        self, name: str, max_outbox: int = MAX_OUTBOX, evict_slow=True
+    ):
+        """
+        Args:
+            name (str): The name of the hub, used for logging.
+            max_outbox (int, optional): The maximum number of messages queued
+                to a client. Defaults to MAX_OUTBOX.
+            evict_slow (bool, optional): Whether clients whose outbox is full
+                are disconnected. Otherwise, their oldest queued message is
+                dropped. Defaults to True.
+        """
+        self.name = name
+        """The name of the hub."""
+        self.published = 0
+        """The number of messages published."""
+        self.sent = 0
+        """The number of messages sent to clients."""
+        self.dropped = 0
+        """The number of messages dropped from full outboxes."""
+        self.evicted = 0
+        """The number of clients disconnected for being too slow."""
+
+        self._max_outbox = max_outbox
+        self._evict_slow = evict_slow
+        self._clients: dict[WebSocketConnection, asyncio.Queue] = {}
+        self._tasks: set[asyncio.Task] = set()  # running disconnections
+
+    @property
+    def clients(self) -> int:
+        """The number of connected clients."""
+        return len(self._clients)
+
+    def publish(self, message: Any):
+        """Publish a message to all clients. Doesn't block.
+
+        Args:
+            message (Any): The message. Text and bytes are sent as is, other
+                objects are sent as JSON.
+        """
+        if not isinstance(message, (str, bytes)):
+            message = json.dumps(message)  # serialize once for all clients
+        self.published += 1
+
+        for socket, outbox in tuple(self._clients.items()):
+            if not outbox.full():
+                outbox.put_nowait(message)
+            elif self._evict_slow:
+                self._evict(socket)
+            else:  # make space for the new message
+                outbox.get_nowait()
+                outbox.put_nowait(message)
+                self.dropped += 1
+
+    async def serve(self, socket: WebSocketConnection):
+        """Send published messages to a connected client until it
+        disconnects. Messages received from the client are ignored.
+
+        Args:
+            socket (WebSocketConnection): The client's connection.
+        """
+        outbox: asyncio.Queue = asyncio.Queue(self._max_outbox)
+        self._clients[socket] = outbox
+        sender = asyncio.create_task(self._send(socket, outbox))
+        LOGGER.debug("%s client connected (%d)", self.name, self.clients)
+
+        try:  # wait for the client to disconnect
+            while True:
+                await socket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:  # failed to receive, drop the client
+            LOGGER.warning("%s client failed: %s", self.name, e)
+        finally:
+            sender.cancel()
+            self._clients.pop(socket, None)
+            LOGGER.debug("%s client disconnected", self.name)
+
+    def stats(self) -> dict[str, int]:
+        """The statistics of the hub."""
+        return {
+            "clients": self.clients,
+            "published": self.published,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+        }
+
+    async def _send(self, socket: WebSocketConnection, outbox: asyncio.Queue):
+        try:
+            while True:
+                await socket.send(await outbox.get())
+                self.sent += 1
+        except WebSocketDisconnect:
+            self._clients.pop(socket, None)
+        except Exception as e:  # failed to send, drop the client
+            LOGGER.warning("%s client failed, disconnecting: %s", self.name, e)
+            self._disconnect(socket)
+
+    def _evict(self, socket: WebSocketConnection):
+        self.evicted += 1
+        LOGGER.warning("%s client too slow, disconnecting", self.name)
+        self._disconnect(socket)
+
+    def _disconnect(self, socket: WebSocketConnection):
+        # disconnected by a task of its own, since serving it is cancelled
+        self._clients.pop(socket, None)
+        task = asyncio.create_task(socket.disconnect())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class EventStream:
+    """A stream of published messages as server-sent events (SSE).
+
+    Recent events are kept in a bounded ring, so that reconnecting clients
+    resume after the last event they received (`Last-Event-ID`) without
+    gaps. Clients wait on a single shared waiter that is woken on every
+    published message, and by a single keep-alive ticker when the stream is
+    idle, instead of each client polling its connection.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        history: int = HISTORY_SIZE,
+        keep_alive: float = KEEP_ALIVE_INTERVAL,
+    ):
+        """
+        Args:
+            name (str): The name of the stream, used for logging.
+            history (int, optional): The number of recent events kept for
+                resuming clients. Defaults to HISTORY_SIZE.
+            keep_alive (float, optional): The interval of keep-alive comments
+                sent when idle (seconds). Defaults to KEEP_ALIVE_INTERVAL.
+        """
+        self.name = name
+        """The name of the stream."""
+        self.clients = 0
+        """The number of connected clients."""
+
+        self._keep_alive = keep_alive
+        self._events: deque[bytes] = deque(maxlen=history)  # recent events
+        self._next_id = 1  # the identifier of the next event
+        self._last_publish = 0.0  # monotonic time of the last event
+        self._waiter: asyncio.Future | None = None  # woken on new events
+        self._ticker: asyncio.Task | None = None  # keep-alive ticker
+
+    def publish(self, message: Any):
+        """Publish a message to all clients. Doesn't block.
+
+        Args:
+            message (Any): The message. Text is sent as is, other objects are
+                sent as JSON.
+        """
+        if not isinstance(message, str):
+            message = json.dumps(message)  # serialize once for all clients
+        data = "".join(f"data: {line}\n" for line in message.split("\n"))
+        self._events.append(f"id: {self._next_id}\n{data}\n".encode())
+        self._next_id += 1
+        self._last_publish = time.monotonic()
+        self._wake(keep_alive=False)
+
+    async def stream(self, last_event_id: int | None = None):
+        """Stream events to a client.
+
+        Args:
+            last_event_id (int, optional): The identifier of the last event
+                the client received. Defaults to streaming all recent events.
+
+        Yields:
+            bytes: Events, in the SSE format.
+        """
+        self.clients += 1
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._tick())
+        next_id = 0 if last_event_id is None else last_event_id + 1
+        LOGGER.debug("%s client connected (%d)", self.name, self.clients)
+
+        try:
+            yield f"retry: {RETRY_INTERVAL}\n\n".encode()
+            while True:
+                if events := self._since(next_id):
+                    next_id = self._next_id
+                    yield b"".join(events)
+                elif await self._wait():  # woken by the keep-alive ticker
+                    yield b": keep-alive\n\n"
+        finally:
+            self.clients -= 1
+            if not self.clients and self._ticker is not None:
+                self._ticker.cancel()
+                self._ticker = None
+            LOGGER.debug("%s client disconnected", self.name)
+
+    def _since(self, event_id: int) -> list[bytes]:
+        # the ring holds the contiguous events before the next identifier
+        if event_id > self._next_id:  # the stream restarted, resend all
+            event_id = 0
+        missed = min(self._next_id - max(event_id, 1), len(self._events))
+        if missed <= 0:
+            return []
+        start = len(self._events) - missed
+        return list(itertools.islice(self._events, start, None))
+
+    async def _wait(self) -> bool:
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(self._waiter)
+
+    def _wake(self, keep_alive: bool):
+        if self._waiter is not None:
+            self._waiter.set_result(keep_alive)
+            self._waiter = None
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self._keep_alive)
+            if time.monotonic() - self._last_publish >= self._keep_alive:
+                self._wake(keep_alive=True)  # only when idle
@@ -11,12 +11,19 @@ the main thread. This is useful for services that require long running tasks.
 It can also be used an cancellation token to stop long running tasks by simply
 adding a cancellation callback to the event; triggering the event will cancel
 the task.
+
+Synchronous callbacks run in the default thread pool. Callbacks that are
+triggered frequently and must run in order (e.g. audio writers) can instead
+be pinned to a dedicated worker thread, which avoids a thread pool submission
+per trigger and contention with other users of the pool.
 """
 
 import asyncio
-import functools
 import logging
-from collections.abc import Callable, Coroutine
+import queue
+import threading
+from collections.abc import Awaitable, Callable, Coroutine
+from enum import Enum
 from typing import Any, Generic, get_args
 
 from typing_extensions import ParamSpec
@@ -28,6 +35,19 @@ P = ParamSpec("P")  # event data type definition
 EVENT_TIMEOUT = 2.5  # seconds
 
 
+class OverflowPolicy(str, Enum):
+    """The policy of a sequential handler when its queue is full."""
+
+    BLOCK = "block"
+    """Block the event until the queue has space."""
+    DROP_OLDEST = "drop_oldest"
+    """Drop the oldest queued trigger to make space for the new one."""
+    DROP_NEWEST = "drop_newest"
+    """Drop the new trigger."""
+    COALESCE = "coalesce"
+    """Replace all queued triggers with the new one."""
+
+
 class EventHandler(Generic[P]):
     """A callback handler of an event. Used to subscribe to events.
 
@@ -42,10 +62,18 @@ class EventHandler(Generic[P]):
         one_shot: bool = False,
         sequential: bool = False,
         timeout: float | None = EVENT_TIMEOUT,
+        max_queue_size: int = 0,
+        overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        threaded: bool = False,
     ):
-        assert asyncio.iscoroutinefunction(callback) or callable(
-            callback
-        ), "Invalid callback type"
+        is_coroutine = asyncio.iscoroutinefunction(callback)
+        assert is_coroutine or callable(callback), "Invalid callback type"
+        assert not threaded or not is_coroutine, "Threaded callback is async"
+        assert (
+            not threaded
+            or not max_queue_size
+            or overflow_policy != OverflowPolicy.BLOCK
+        ), "Threaded callbacks can't block the event"
 
         self.callback = callback
         """The callback function."""
@@ -55,81 +83,172 @@ class EventHandler(Generic[P]):
         """Whether the callback blocks the event from proceeding."""
         self.sequential = sequential
         """Whether the callback blocks future callbacks."""
+        self.threaded = threaded
+        """Whether the callback runs in order on a dedicated worker thread."""
+        self.overflow_policy = overflow_policy
+        """The policy of a queued callback when its queue is full."""
+        self.queued = 0
+        """The number of triggers queued by a sequential or threaded
+        callback, and not dropped: the triggers processed or waiting."""
+        self.dropped = 0
+        """The number of triggers dropped by a sequential or threaded
+        callback, either rejected or evicted from the queue."""
 
         self._triggered = False  # whether the callback has been triggered
         self._timeout = timeout  # the timeout of the callback (seconds)
+        self._is_coroutine = is_coroutine  # whether callback is a coroutine
 
-        self._blocking_queue: asyncio.Queue = asyncio.Queue()
-        # queue of callbacks for blocking handlers
+        self._blocking_queue: asyncio.Queue = asyncio.Queue(max_queue_size)
+        # queue of callbacks for blocking handlers, unbounded if size is 0
+        self._queue_task: asyncio.Task | None = None
+        # task processing the queue of blocking handlers
         self._running_tasks: set[asyncio.Task] = set()
         # set of all running tasks, including queue processing task
 
+        self._max_queue_size = max_queue_size
+        self._work_queue: queue.SimpleQueue = queue.SimpleQueue()
+        # queue of triggers handed off to the worker thread
+        self._worker: threading.Thread | None = None
+        # worker thread of threaded handlers, started on first trigger
+
     async def trigger(self, *args: P.args, **kwargs: P.kwargs):
         """Trigger the callback."""
         assert not self._triggered or not self.one_shot, "Callback is one-shot"
 
-        @self._timeout_wrapper(self._timeout)
-        async def handler_with_timeout(*args: P.args, **kwargs: P.kwargs):
+        if self.threaded:  # hand off to the worker thread
+            self._submit((args, kwargs))
+            return
+        elif self.sequential:  # block future callbacks
+            await self._enqueue((args, kwargs))
+            if self._queue_task and not self._queue_task.done():
+                return  # queue is already processing
+            task = asyncio.create_task(self._process_blocking_queue())
+            self._queue_task = task
+        elif self.blocking:  # block event loop
+            await self._run(*args, **kwargs)
+            return
+        else:  # run in background
+            task = asyncio.create_task(self._run(*args, **kwargs))
+
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    def close(self, wait: bool = False):
+        """Stop the worker thread of a threaded callback once the triggers
+        already handed off to it are processed. Must be called when a threaded
+        handler is no longer used, as its worker thread keeps it alive.
+
+        Args:
+            wait (bool, optional): Whether to block until the worker thread
+                has processed all triggers. Defaults to False.
+        """
+        if self._worker is not None:
+            worker = self._worker
+            self._work_queue.put(None)
+            self._work_queue = queue.SimpleQueue()  # for a future worker
+            self._worker = None
+            if wait:
+                worker.join()
+
+    @property
+    def queue_size(self) -> int:
+        """The number of triggers waiting in the queue of a sequential or
+        threaded callback."""
+        if self.threaded:
+            return self._work_queue.qsize()
+        return self._blocking_queue.qsize()
+
+    def _submit(self, item: tuple):
+        # hand off a trigger to the worker thread, applying overflow policy
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._work,
+                args=(self._work_queue,),
+                name=f"{self}-worker",
+                daemon=True,
+            )
+            self._worker.start()
+
+        work_queue = self._work_queue
+        if self._max_queue_size and work_queue.qsize() >= self._max_queue_size:
+            if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                self.dropped += 1
+                return
+            drops = 1  # drop oldest
+            if self.overflow_policy == OverflowPolicy.COALESCE:
+                drops = work_queue.qsize()
+            for _ in range(drops):
+                try:  # the worker may empty the queue concurrently
+                    work_queue.get_nowait()
+                    self.queued -= 1
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+
+        work_queue.put(item)
+        self.queued += 1
+
+    def _work(self, work_queue: queue.SimpleQueue):
+        while (item := work_queue.get()) is not None:
+            args, kwargs = item
             try:
-                return await self._handler(*args, **kwargs)
-            except asyncio.CancelledError:
-                LOGGER.debug("%s: Cancelled", self)
+                self.callback(*args, **kwargs)
             except Exception as e:
                 LOGGER.exception("%s: Error executing callback: %s", self, e)
             finally:
                 self._triggered = True  # callback was triggered
 
-        if self.sequential:  # block future callbacks
-            await self._blocking_queue.put(
-                (handler_with_timeout, args, kwargs)
-            )  # schedule callback
-            if len(self._running_tasks) != 0:  # queue is already processing
+    async def _enqueue(self, item: tuple):
+        # schedule a callback, applying the overflow policy if queue is full
+        queue = self._blocking_queue
+        if queue.full():
+            if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                self.dropped += 1
                 return
-            task = asyncio.create_task(self._process_blocking_queue())
-        elif self.blocking:  # block event loop
-            await handler_with_timeout(*args, **kwargs)
-            return
-        else:  # run in background
-            task = asyncio.create_task(handler_with_timeout(*args, **kwargs))
+            elif self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                self._drop_queued(1)
+            elif self.overflow_policy == OverflowPolicy.COALESCE:
+                self._drop_queued(queue.qsize())
 
-        self._running_tasks.add(task)
-        task.add_done_callback(self._running_tasks.discard)
+        await queue.put(item)  # blocks if queue is still full
+        self.queued += 1
+
+    def _drop_queued(self, count: int):
+        for _ in range(count):
+            try:
+                self._blocking_queue.get_nowait()
+                self._blocking_queue.task_done()
+                self.queued -= 1
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                break
 
     async def _process_blocking_queue(self):
         while not self._blocking_queue.empty():
-            (
-                handler_with_timeout,
-                args,
-                kwargs,
-            ) = await self._blocking_queue.get()
-            await handler_with_timeout(*args, **kwargs)
+            args, kwargs = await self._blocking_queue.get()
+            await self._run(*args, **kwargs)
             self._blocking_queue.task_done()
 
-    async def _handler(self, *args: P.args, **kwargs: P.kwargs):
-        if asyncio.iscoroutinefunction(self.callback):
+    async def _run(self, *args: P.args, **kwargs: P.kwargs):
+        try:
+            if self._timeout is None:  # no timeout wrapper needed
+                return await self._handler(*args, **kwargs)
+            return await asyncio.wait_for(
+                self._handler(*args, **kwargs), self._timeout
+            )
+        except asyncio.TimeoutError:
+            LOGGER.error("%s timed out after %s seconds", self, self._timeout)
+        except asyncio.CancelledError:
+            LOGGER.debug("%s: Cancelled", self)
+        except Exception as e:
+            LOGGER.exception("%s: Error executing callback: %s", self, e)
+        finally:
+            self._triggered = True  # callback was triggered
+
+    def _handler(self, *args: P.args, **kwargs: P.kwargs) -> Awaitable:
+        if self._is_coroutine:
             return self.callback(*args, **kwargs)
-        elif callable(self.callback):
-            return asyncio.to_thread(self.callback, *args, **kwargs)
-        else:
-            raise TypeError(f"Invalid callback type: {type(self.callback)}")
-
-    def _timeout_wrapper(self, duration: float | None):
-        # add timeout to callback
-        def decorator(func: Callable[..., Coroutine]):
-            @functools.wraps(func)
-            async def wrapper(*args, **kwargs):
-                try:
-                    return await asyncio.wait_for(
-                        await func(*args, **kwargs), duration
-                    )
-                except asyncio.TimeoutError:
-                    LOGGER.error(
-                        "%s timed out after %s seconds", self, duration
-                    )
-
-            return wrapper
-
-        return decorator
+        return asyncio.to_thread(self.callback, *args, **kwargs)
 
     async def __call__(self, *args: P.args, **kwargs: P.kwargs):
         return await self.trigger(*args, **kwargs)
@@ -153,6 +272,8 @@ class Event(Generic[P]):
     def __init__(self):
         self.handlers: set[EventHandler[P]] = set()
         """The callback handlers of the event."""
+        self._snapshot: tuple[EventHandler[P], ...] = ()
+        # immutable copy of the handlers, rebuilt when subscriptions change
         self._handlers_lock = asyncio.Lock()
         self._event = asyncio.Event()
 
@@ -161,20 +282,24 @@ class Event(Generic[P]):
         async with self._handlers_lock:
             LOGGER.debug("%s: Subscribing %s", self, handler)
             self.handlers.add(handler)
+            self._snapshot = tuple(self.handlers)
 
     async def unsubscribe(self, handler: EventHandler[P]):
         """Unsubscribe from the event."""
         async with self._handlers_lock:
             LOGGER.debug("%s: Unsubscribing %s", self, handler)
             self.handlers.remove(handler)
+            self._snapshot = tuple(self.handlers)
 
     async def trigger(self, *args: P.args, **kwargs: P.kwargs):
         """Trigger the event."""
         self._event.set()
-        for handler in set(self.handlers):
-            LOGGER.debug("%s: Triggering %s", self, handler)
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        for handler in self._snapshot:
+            if debug:  # avoid formatting the message on every trigger
+                LOGGER.debug("%s: Triggering %s", self, handler)
             try:
-                await handler(*args, **kwargs)
+                await handler.trigger(*args, **kwargs)
             except Exception as e:
                 LOGGER.exception("Error executing %s: %s", handler, e)
             if handler.one_shot:  # done in background to avoid deadlocks
@@ -203,6 +328,7 @@ class Event(Generic[P]):
 
     def __del__(self):
         self._event.clear()
+        self._snapshot = ()
         handlers_array = list(self.handlers)
         for i in range(len(handlers_array) - 1, -1, -1):
             self.handlers.remove(handlers_array[i])
@@ -0,0 +1,239 @@
+"""
+Sessions service. Runs an isolated audio pipeline per audio source.
+
+Every connected audio source (e.g. a trainee's microphone) gets its own
+session: its own microphone, player, speaker, recorder and transcriber, its
+own transcript event, its own transcript and audio monitor broadcasts, and its
+own archive (see `audio.archive`). Sessions share no mutable state, so their
+transcripts never interleave.
+
+Resources are limited globally by the number of sessions
+(`MAX_SESSIONS`) and the number of audio decoding processes
+(`microphones.MAX_DECODERS`), and per session by the number of transcript
+viewers (`MAX_SESSION_VIEWERS`).
+
+Clients that don't select a session follow the default session, the oldest
+running one.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict
+
+from fastapi import WebSocketDisconnect
+
+from ..models.microphone import MicrophoneConfig
+from ..models.transcript import TranscriptDelta
+from . import transcription
+from .audio import archive, clips, microphones, player, speakers
+from .audio.monitor import AudioMonitor
+from .broadcast import BroadcastHub, EventStream
+from .events import Event, EventHandler
+from .websocket import WebSocketConnection
+
+LOGGER = logging.getLogger(__name__)
+"""Sessions service logger."""
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 4))
+"""The maximum number of sessions running at a time."""
+MAX_SESSION_VIEWERS = 100
+"""The maximum number of transcript viewers of a session."""
+
+
+class Session:
+    """An audio session. Holds the pipeline of an audio source."""
+
+    def __init__(
+        self,
+        mic_config: MicrophoneConfig,
+        audio_event: Event[bytes],
+        transcript_event: Event[TranscriptDelta],
+    ):
+        """
+        Args:
+            mic_config (MicrophoneConfig): The audio source configuration.
+            audio_event (Event[bytes]): The event of the session's audio.
+            transcript_event (Event[TranscriptDelta]): The event of the
+                session's transcripts.
+        """
+        self.id = uuid.uuid4().hex[:8]
+        """The identifier of the session."""
+        self.mic_config = mic_config
+        """The configuration of the session's audio source."""
+        self.started = time.time()
+        """The start time of the session (seconds since the epoch)."""
+        self.audio_event = audio_event
+        """The event triggered with the session's audio."""
+        self.transcript_event = transcript_event
+        """The event triggered with the session's transcripts."""
+        self.transcript_hub = BroadcastHub(f"Transcription {self.id}")
+        """The hub broadcasting transcripts to websocket clients."""
+        self.transcript_stream = EventStream(f"Transcription {self.id}")
+        """The stream of transcripts to server-sent events clients."""
+        self.monitor = AudioMonitor()
+        """The monitor of the session's audio."""
+
+    def info(self) -> dict:
+        """The description of the session."""
+        return {
+            "id": self.id,
+            "started": self.started,
+            "mic_config": asdict(self.mic_config),
+            "transcript_viewers": self.transcript_hub.clients,
+            "transcript_stream_viewers": self.transcript_stream.clients,
+            "audio_listeners": self.monitor.stats(),
+        }
+
+
+class SessionManager:
+    """Starts, tracks and stops sessions."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        """
+        Args:
+            max_sessions (int, optional): The maximum number of sessions
+                running at a time. Defaults to MAX_SESSIONS.
+        """
+        self.sessions: dict[str, Session] = {}
+        """The running sessions, by identifier, oldest first."""
+        self.default_hub = BroadcastHub("Transcription")
+        """The hub broadcasting the default session's transcripts."""
+        self.default_stream = EventStream("Transcription")
+        """The stream of the default session's transcripts."""
+
+        self._max_sessions = max_sessions
+        self._starting = 0  # number of sessions being started
+
+    @property
+    def default(self) -> Session | None:
+        """The default session, the oldest running one."""
+        return next(iter(self.sessions.values()), None)
+
+    def get(self, session_id: str | None = None) -> Session | None:
+        """Get a running session.
+
+        Args:
+            session_id (str, optional): The identifier of the session.
+                Defaults to the default session.
+
+        Returns:
+            Session | None: The session, or None if it's not running.
+        """
+        if session_id is None:
+            return self.default
+        return self.sessions.get(session_id)
+
+    async def start(self, socket: WebSocketConnection) -> Session:
+        """Start a session streaming audio from a websocket. The session
+        stops when the websocket disconnects.
+
+        Args:
+            socket (WebSocketConnection): The audio source.
+
+        Returns:
+            Session: The started session.
+
+        Raises:
+            SessionLimitError: If `MAX_SESSIONS` sessions are running.
+            DecoderLimitError: If the audio source needs a decoder while all
+                decoders are in use.
+            WebSocketDisconnect: If the websocket disconnected while the
+                session was starting.
+        """
+        if len(self.sessions) + self._starting >= self._max_sessions:
+            raise SessionLimitError(f"{len(self.sessions)} sessions running")
+
+        self._starting += 1  # reserved until the session is registered
+        try:
+            mic, config, mic_token = await microphones.create_websocket_mic(
+                socket
+            )
+        except BaseException:
+            self._starting -= 1
+            raise
+
+        # stop the session on disconnection, even while it's starting
+        cleanups: list[Callable[[], Awaitable]] = [mic_token]
+        session: Session | None = None
+        stopping = False
+
+        async def stop():
+            nonlocal stopping
+            stopping = True
+            running = session is not None and bool(
+                self.sessions.pop(session.id, None)
+            )
+            while cleanups:  # stop what was started, newest first
+                await cleanups.pop()()
+            if running:
+                LOGGER.info("Session %s stopped", session.id)
+
+        stop_handler = EventHandler(stop, one_shot=True)
+        await socket.disconnection_event.subscribe(stop_handler)
+
+        # start the pipeline
+        try:
+            audio_event, player_token = await player.start_audio_player(mic)
+            cleanups.append(player_token)
+            speaker_token = await speakers.start_speaker(config, audio_event)
+            cleanups.append(speaker_token)
+            clips.library.preload(config)  # decode clips ahead of playing
+            transcript_event, transcription_token = await transcription.start(
+                config, audio_event
+            )
+            cleanups.append(transcription_token)
+
+            session = Session(config, audio_event, transcript_event)
+            self.sessions[session.id] = session
+            self._starting -= 1
+            publisher = EventHandler(
+                self._create_publisher(session), blocking=True, timeout=None
+            )
+            await session.transcript_event.subscribe(publisher)
+            cleanups.append(lambda: transcript_event.unsubscribe(publisher))
+            await session.monitor.attach(config, audio_event)
+            cleanups.append(session.monitor.detach)
+            if archive.ARCHIVE_SESSIONS:
+                cleanups.append(
+                    await archive.start_archive(
+                        session.id, config, audio_event, transcript_event
+                    )
+                )
+        except BaseException:
+            if session is None:  # not registered yet, release its slot
+                self._starting -= 1
+            await stop()
+            raise
+        if stopping:  # disconnected while starting
+            await stop()
+            raise WebSocketDisconnect
+        LOGGER.info("Session %s started (%d running)", session.id, len(self))
+        return session
+
+    def _create_publisher(self, session: Session):
+        # broadcast the session's transcripts, serialized once
+        async def publish(delta: TranscriptDelta):
+            message = json.dumps(asdict(delta))
+            session.transcript_hub.publish(message)
+            session.transcript_stream.publish(message)
+            if self.default is session:
+                self.default_hub.publish(message)
+                self.default_stream.publish(message)
+
+        return publish
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+class SessionLimitError(Exception):
+    """An error raised when no more sessions can be started."""
+
+    ...
+
+
+manager = SessionManager()
+"""The global session manager."""
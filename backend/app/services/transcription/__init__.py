@@ -7,11 +7,10 @@ interfaces that allow for real-time speech recognition.
 
 The service consists of 3 main components:
 
-- The recorder: This component is responsible for recording audio from an audio
-  source. It uses the SpeechRecognition library apply filters to the audio,
-  which can be extended.
+- The recorder: This component is responsible for recording speech from an
+  audio source. It segments the audio using its energy, following the
+  SpeechRecognition library's algorithm, which can be extended.
 - The engine: This component is responsible for converting audio data to text.
-  It also holds the Recognizer object from the SpeechRecognition library.
 - The transcription: This component is responsible for transcribing the audio
   data progressively, as it is received from the recorder.
 
@@ -33,7 +32,9 @@ The service takes in the following:
 - mic_config: MicrophoneConfig
 - audio_source: Event[bytes]
 
-And it sets up a transcription event that is used to process transcriptions.
+And it returns a transcription event that is used to process transcriptions.
+Each started transcription has its own event, so concurrent audio sources are
+transcribed independently.
 """
 
 import logging
@@ -41,4 +42,4 @@ import logging
 LOGGER = logging.getLogger(__name__)
 """Transcription module logger."""
 
-from .core import event, start
+from .core import start, stats
@@ -0,0 +1,63 @@
+"""
+Calibration cache. Persists the energy thresholds that recorders calibrated
+for each audio source (a capture device or a room), so new sessions start
+from a calibrated threshold instead of waiting to adjust for ambient noise.
+The cache is stored next to the configuration file, in `calibration.json`.
+"""
+
+import json
+import os
+
+from ... import data_dir
+from . import LOGGER
+
+DEFAULT_SOURCE = "default"
+"""The key of audio sources that don't identify themselves."""
+
+calibration_file = os.path.join(data_dir, "calibration.json")
+"""The calibration cache file path."""
+_thresholds: dict[str, float] = {}  # calibrated thresholds by audio source
+
+
+def get_threshold(source: str) -> float | None:
+    """Get the cached energy threshold of an audio source.
+
+    Args:
+        source (str): The audio source's device or room identifier.
+
+    Returns:
+        float | None: The cached threshold, if the source was calibrated.
+    """
+    return _thresholds.get(source or DEFAULT_SOURCE)
+
+
+def store_threshold(source: str, threshold: float):
+    """Cache the calibrated energy threshold of an audio source.
+
+    Args:
+        source (str): The audio source's device or room identifier.
+        threshold (float): The calibrated energy threshold.
+    """
+    _thresholds[source or DEFAULT_SOURCE] = round(threshold, 1)
+    try:
+        with open(calibration_file, "w") as file:
+            json.dump(_thresholds, file, indent=4)
+    except Exception as e:
+        LOGGER.exception(f"Error storing calibration: {e}")
+
+
+def _load_thresholds(calibration_file: str) -> dict[str, float]:
+    try:
+        with open(calibration_file, "r") as file:
+            return {
+                source: float(threshold)
+                for source, threshold in json.load(file).items()
+            }
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        LOGGER.exception(f"Error loading calibration: {e}")
+        return {}
+
+
+_thresholds = _load_thresholds(calibration_file)
@@ -0,0 +1,90 @@
+"""
+HTTP connections of the recognition engines.
+
+The engines share a single session whose connections are kept alive between
+requests, so that recognition requests don't pay for a TCP and TLS handshake
+every time. Connections are warmed up ahead of the first request.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import requests.adapters
+
+from . import LOGGER
+
+POOL_SIZE = 4
+"""The maximum number of kept-alive connections per host."""
+CONNECT_TIMEOUT = 3.05
+"""The maximum duration of establishing a connection (seconds)."""
+READ_TIMEOUT = 15
+"""The maximum duration between bytes of a response (seconds)."""
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTP adapter that keeps a pool of connections alive per host and
+    applies its own timeouts to every request."""
+
+    def __init__(self, pool_size: int, timeout: tuple[float, float]):
+        """
+        Args:
+            pool_size (int): The maximum number of connections per host.
+            timeout (tuple[float, float]): The connect and read timeouts.
+        """
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.timeout = timeout
+        """The connect and read timeouts of requests (seconds)."""
+
+    def send(self, request, **kwargs):  # type: ignore
+        kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(
+    pool_size: int = POOL_SIZE,
+    timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+) -> requests.Session:
+    """Create an HTTP session with a pool of kept-alive connections.
+
+    Args:
+        pool_size (int, optional): The maximum number of connections per
+            host. Defaults to POOL_SIZE.
+        timeout (tuple[float, float], optional): The connect and read
+            timeouts. Defaults to (CONNECT_TIMEOUT, READ_TIMEOUT).
+
+    Returns:
+        requests.Session: The session.
+    """
+    adapter = PooledHTTPAdapter(pool_size, timeout)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def warm_up(url: str, count: int):
+    """Open connections to a host in the background, so that they are ready
+    for the first requests.
+
+    Args:
+        url (str): The URL of the host.
+        count (int): The number of connections to open.
+    """
+
+    def connect(_):
+        try:  # any response leaves an open connection in the pool
+            session.head(url).close()
+        except requests.RequestException as e:
+            LOGGER.warning("Failed to connect to %s: %s", url, e)
+
+    def warm_up_connections():
+        with ThreadPoolExecutor(count) as executor:
+            executor.map(connect, range(count))  # concurrent, for new ones
+        LOGGER.debug("Opened %d connections to %s", count, url)
+
+    threading.Thread(target=warm_up_connections, daemon=True).start()
+
+
+session = create_session()
+"""The HTTP session shared by the recognition engines."""
@@ -1,29 +1,37 @@
 """Transcription service core functionality."""
 
 import asyncio
+import os
 from datetime import datetime, timedelta
 
 import speech_recognition as sr  # type: ignore
 
 from ...models.microphone import MicrophoneConfig
-from ..events import Event, EventHandler
+from ...models.transcript import TranscriptDelta
+from ..events import Event, EventHandler, OverflowPolicy
 from . import LOGGER, recorder
-from .engines import RecognitionEngineError, UnrecognizedAudioError, recognize
+from .engines import (
+    RecognitionEngineError,
+    UnrecognizedAudioError,
+    recognize,
+    router,
+    scheduler,
+    upload_stats,
+)
+
+INCREMENTAL_TRANSCRIPTION = True
+"""Whether to only re-recognize the unstable tail of a phrase. If disabled,
+the whole phrase is recognized on every update."""
+WINDOW_DURATION = 6
+"""The maximum duration of audio recognized at a time (seconds)."""
+WINDOW_OVERLAP = 1
+"""The duration of audio shared between consecutive windows (seconds)."""
+MAX_PHRASE_DURATION = 30
+"""The maximum duration of a phrase before it is terminated (seconds)."""
 
-RECORD_TIMEOUT = 0.5
-"""The maximum audio recording chunk size (seconds)."""
-ENERGY_THRESHOLD = 1000
-"""The energy threshold for recording audio."""
-DYNAMIC_ENERGY_THRESHOLD = False
-"""Whether to dynamically adjust the energy threshold for recording audio."""
-
-PHRASE_TERMINATOR = "\n"
-"""The indicator of an end of a phrase."""
 _PHRASE_TIMEOUT = 2.5  #  the maximum pause between phrases (seconds)
 _MIN_RECORD_DURATION = 0.5  # the minimum recording duration (seconds)
-
-_transcription_event: Event[str] = Event[str]()
-"""The global transcription event."""
+_MAX_QUEUED_RECORDINGS = 8  # the maximum recordings waiting to be transcribed
 
 
 async def start(mic_config: MicrophoneConfig, audio_source: Event[bytes]):
@@ -36,7 +44,8 @@ async def start(mic_config: MicrophoneConfig, audio_source: Event[bytes]):
         data.
 
     Returns:
-        CancellationToken: The transcription cancellation token.
+        Tuple[Event[TranscriptDelta], CancellationToken]: The transcription
+            event and the cancellation token.
     """
 
     # start listening to the microphone
@@ -44,99 +53,308 @@ async def start(mic_config: MicrophoneConfig, audio_source: Event[bytes]):
         mic_config, audio_source
     )
     # initialize transcription
-    audio_handler = await _create_handler(mic_config)
+    transcription_event = Event[TranscriptDelta]()
+    tasks: set[asyncio.Task] = set()  # running transcription tasks
+    audio_handler = await _create_handler(
+        mic_config, transcription_event, tasks
+    )
     await audio_event.subscribe(audio_handler)
 
     async def stop():  # stop recording and transcribing
         await audio_event.unsubscribe(audio_handler)
         await cancel_recorder()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     cancellation_event: Event[...] = Event()
     await cancellation_event.subscribe(EventHandler(stop, one_shot=True))
-    return cancellation_event
+    return transcription_event, cancellation_event
 
 
-def event():
-    """Get the global transcription event.
+def stats() -> dict:
+    """Get the statistics of the transcription service.
 
     Returns:
-        Event[str]: The transcription event.
+        dict: The statistics of the recognition scheduler and router, and of
+            the audio uploaded to the Whisper API.
     """
-    return _transcription_event
+    return {
+        "scheduler": scheduler.stats(),
+        "routing": router.stats(),
+        "uploads": dict(upload_stats),
+    }
 
 
-async def _create_handler(mic_config: MicrophoneConfig):
-    """Create a transcription event that triggers when new transcriptions are
-    available and an audio handler that processes audio data.
+async def _create_handler(
+    mic_config: MicrophoneConfig,
+    transcription_event: Event[TranscriptDelta],
+    tasks: set[asyncio.Task],
+):
+    """Create an audio handler that processes audio data and triggers the
+    transcription event when new transcriptions are available.
 
     Args:
         mic_config (MicrophoneConfig): The microphone configuration.
+        transcription_event (Event[TranscriptDelta]): The event triggered
+            with transcriptions.
+        tasks (set[asyncio.Task]): The set of running transcription tasks,
+            to which the handler's tasks are added.
 
     Returns:
-        Event[str]: The transcription event.
         EventHandler: The audio date handler.
     """
     phrase_time = datetime.min  # last time new audio was received
-    phrase_buffer = bytes()  # buffer of incomplete phrase audio
+    phrase = _Phrase(mic_config)  # the phrase being transcribed
 
     # mutex locks
     time_lock = asyncio.Lock()
     buffer_lock = asyncio.Lock()
 
-    async def handler(audio_data: sr.AudioData):
-        nonlocal phrase_time, phrase_buffer
+    async def handler(segment: recorder.SpeechSegment):
+        nonlocal phrase_time, phrase
 
-        # check for a new phrase (pause in speech)
+        # check for a new phrase (end of speech or pause)
         async with time_lock:
             now = datetime.now()
-            if now - phrase_time > timedelta(seconds=_PHRASE_TIMEOUT):
-                # indicate a pause between phrases
-                await _transcription_event.trigger(PHRASE_TERMINATOR)
-                phrase_buffer = bytes()
+            if (
+                phrase.ended
+                or now - phrase_time > timedelta(seconds=_PHRASE_TIMEOUT)
+                or phrase.duration >= MAX_PHRASE_DURATION
+            ):  # indicate a pause between phrases
+                await finish(phrase)
+                phrase = _Phrase(mic_config)
             phrase_time = now  # update last time new audio was received
 
         # add audio data to buffer
         async with buffer_lock:
-            phrase_buffer += audio_data.get_raw_data()
+            phrase.append(segment)
+            phrase.ended = segment.final  # finished once transcribed
             if (  # check if the buffer is too small
-                len(phrase_buffer)
-                < mic_config.sample_rate * _MIN_RECORD_DURATION
+                len(phrase.window) < phrase.byte_rate * _MIN_RECORD_DURATION
             ):  #  wait for more audio data (api minimum is 0.1s)
+                if phrase.ended:
+                    await finish(phrase)
                 return
+            window = bytes(phrase.window)
 
-        try:  # transcribe the audio
-            audio_data = sr.AudioData(
-                phrase_buffer,
-                mic_config.sample_rate,
-                mic_config.sample_width,
+        # transcribe in the background, superseding pending transcriptions
+        task = asyncio.create_task(
+            transcribe(
+                phrase, window, phrase.window_offset, phrase.end, phrase.ended
+            )
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def transcribe(
+        phrase: _Phrase,
+        window: bytes,
+        window_offset: int,
+        end: float,
+        final: bool,
+    ):
+        try:  # transcribe the audio, recording the requests sent
+            transcription = await recognize(
+                sr.AudioData(
+                    window, mic_config.sample_rate, mic_config.sample_width
+                ),
+                key=phrase.id,
+                on_sent=lambda latency: phrase.record_request(
+                    len(window), latency
+                ),
             )
         except UnrecognizedAudioError:
-            return  # wait for more audio data
+            transcription = None  # wait for more audio data
         except RecognitionEngineError as e:
             LOGGER.exception("Error recognizing audio: %s", e)
+            transcription = None
+
+        # broadcast the changes, unless a newer transcript already was
+        delta = None
+        async with buffer_lock:
+            if transcription is not None and not phrase.terminated:
+                delta = phrase.update(
+                    transcription, window_offset, len(window), end
+                )
+        if delta is not None:
+            await transcription_event.trigger(delta)
+        if final:  # the last audio of the phrase was transcribed
+            await finish(phrase)
+
+    async def finish(phrase: _Phrase):
+        # broadcast the final transcription of a phrase, once
+        if phrase.terminated:
             return
+        phrase.terminated = True
+        scheduler.forget(phrase.id)
+        if delta := phrase.finish():
+            await transcription_event.trigger(delta)
+        phrase.report()
+
+    return EventHandler(
+        handler,
+        timeout=None,
+        sequential=True,
+        max_queue_size=_MAX_QUEUED_RECORDINGS,
+        overflow_policy=OverflowPolicy.BLOCK,  # recordings must not be lost
+    )
 
-        # broadcast the transcript
-        transcription = await recognize(audio_data)
-        await _transcription_event.trigger(transcription)
 
-    return EventHandler(handler, timeout=None, sequential=True)
+class _Phrase:
+    """A phrase being transcribed. Audio that is older than the recognition
+    window is dropped and its transcription committed as the stable prefix of
+    the phrase; only the remaining (unstable) tail is re-recognized."""
+
+    _count = 0  # number of phrases created
+
+    def __init__(self, mic_config: MicrophoneConfig):
+        _Phrase._count += 1
+        self.id = _Phrase._count  # the identifier of the phrase
+        self.terminated = False  # whether the phrase was finished
+        self.ended = False  # whether the recorder ended the phrase
+        self.frame_size = mic_config.sample_width * mic_config.num_channels
+        self.frame_rate = mic_config.sample_rate
+        self.byte_rate = self.frame_rate * self.frame_size  # bytes per second
+        self.window = bytearray()  # the audio that is still recognized
+        self.window_offset = 0  # offset of the window in the phrase (bytes)
+        self.duration = 0.0  # the total duration of the phrase (seconds)
+        self.committed = ""  # the stable prefix of the transcription
+        self.tail = ""  # the latest transcription of the window
+        self.text = ""  # the latest broadcast transcription
+        self.revision = 0  # the number of broadcast updates
+        self.start: float | None = None  # start in the audio stream (s)
+        self.end = 0.0  # end of the received audio in the stream (s)
+
+        # statistics
+        self.bytes_sent = 0
+        self.latencies: list[float] = []
+
+    def append(self, segment: recorder.SpeechSegment):
+        """Add a new recording to the phrase."""
+        self.window += segment.data
+        self.duration += len(segment.data) / self.byte_rate
+        if self.start is None:
+            self.start = segment.start / self.frame_rate
+        self.end = segment.end / self.frame_rate
+
+    def update(
+        self,
+        transcription: str,
+        window_offset: int,
+        window_size: int,
+        end: float,
+    ) -> TranscriptDelta | None:
+        """Update the phrase with the transcription of its window.
+
+        Args:
+            transcription (str): The transcription of the window.
+            window_offset (int): The offset of the recognized window in the
+                phrase, in bytes.
+            window_size (int): The size of the recognized window, in bytes.
+            end (float): The end of the recognized window in the stream.
+
+        Returns:
+            TranscriptDelta | None: The changes to the transcription of the
+                phrase, or None if it didn't change or if the window has slid
+                since it was recognized.
+        """
+        if window_offset != self.window_offset:
+            return None  # transcription of committed audio
+
+        words = _strip_overlap(self.committed, transcription).split()
+        self.tail = " ".join(words)
+
+        window_limit = self.byte_rate * WINDOW_DURATION
+        if INCREMENTAL_TRANSCRIPTION and window_size >= window_limit:
+            # commit the words preceding the overlap and slide the window
+            overlap = int(self.frame_rate * WINDOW_OVERLAP) * self.frame_size
+            unstable = round(len(words) * overlap / window_size)
+            stable, words = words[: len(words) - unstable], words[-unstable:]
+
+            self.committed = " ".join([self.committed, *stable]).strip()
+            self.tail = " ".join(words) if unstable else ""
+            committed = max(window_size - overlap, 0)
+            del self.window[:committed]
+            self.window_offset += committed
+        return self._delta(" ".join([self.committed, self.tail]).strip(), end)
+
+    def finish(self) -> TranscriptDelta | None:
+        """Mark the end of the phrase.
+
+        Returns:
+            TranscriptDelta | None: The final update of the phrase, or None if
+                nothing of the phrase was broadcast.
+        """
+        if not self.revision:
+            return None
+        return self._delta(self.text, self.end, final=True)
+
+    def _delta(
+        self, text: str, end: float, final: bool = False
+    ) -> TranscriptDelta | None:
+        # describe the text as the suffix that differs from the previous one
+        if text == self.text and not final:
+            return None
+        stable = len(os.path.commonprefix([self.text, text]))
+        self.text = text
+        self.revision += 1
+        return TranscriptDelta(
+            self.id,
+            self.revision,
+            stable,
+            text[stable:],
+            self.start or 0.0,
+            end,
+            final,
+        )
+
+    def record_request(self, size: int, latency: float):
+        """Record a recognition request of the phrase."""
+        self.bytes_sent += size
+        self.latencies.append(latency)
+
+    def report(self):
+        """Log the statistics of the phrase."""
+        if not self.latencies:
+            return
+        LOGGER.info(
+            "Phrase of %.1fs transcribed: %d requests, %d bytes sent, "
+            "latency avg %.2fs / max %.2fs",
+            self.duration,
+            len(self.latencies),
+            self.bytes_sent,
+            sum(self.latencies) / len(self.latencies),
+            max(self.latencies),
+        )
+
+
+def _strip_overlap(committed: str, transcription: str) -> str:
+    # remove the committed words that are repeated by the new transcription
+    committed_words = committed.lower().split()
+    words = transcription.split()
+    for size in range(min(len(committed_words), len(words)), 0, -1):
+        prefix = [word.lower() for word in words[:size]]
+        if committed_words[-size:] == prefix:
+            return " ".join(words[size:])
+    return transcription
 
 
 def create_console_display():
     """Create a display that prints transcriptions to the console."""
 
     max_lines = 5
-    lines = []
+    lines: list[str] = []
+    phrase_id = None  # the phrase of the last line
 
-    async def display(transcript: str):
-        nonlocal lines
-        if transcript == PHRASE_TERMINATOR:
+    async def display(delta: TranscriptDelta):
+        nonlocal lines, phrase_id
+        if delta.phrase_id != phrase_id:
+            phrase_id = delta.phrase_id
             lines.append("")
             if len(lines) > max_lines:
                 lines = lines[-max_lines:]
-        else:
-            lines[-1] = transcript
+        lines[-1] = lines[-1][: delta.stable_length] + delta.text
 
         print("Transcription:")
         print("\n".join(lines), end="\r", flush=True)
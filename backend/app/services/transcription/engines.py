@@ -6,54 +6,255 @@ methods for converting audio data to text.
 """
 
 import asyncio
+import io
+import json
 import os
-from collections.abc import Callable
+import subprocess
+import threading
+import time
+from collections.abc import Callable, Hashable
 
 import openai
 import openai.error
+import requests
 import speech_recognition as sr  # type: ignore
 
 from ...models.config import Config
+from .. import configurator
 from ..configurator import register_validator
-from . import LOGGER
+from . import LOGGER, connections, local
+from .routing import EngineRouter
 
 OPENAI_API_KEY = ""
 """The OpenAI API key."""
-recognizer = sr.Recognizer()
-"""The speech recognition engine."""
-active_engine: Callable[[sr.AudioData], str]
-"""The active recognition engine."""
+MAX_IN_FLIGHT = 2
+"""The maximum number of recognition requests running at a time."""
+UPLOAD_SAMPLE_RATE = 16000
+"""The sample rate of uploaded audio, the rate used by the Whisper model."""
+UPLOAD_CODECS = ("flac", "opus", "wav")
+"""The supported codecs of uploaded audio."""
+OPUS_BITRATE = "24k"
+"""The bitrate of uploaded Opus audio."""
+GOOGLE_API_URL = os.getenv(
+    "GOOGLE_API_URL", "http://www.google.com/speech-api/v2/recognize"
+)
+"""The URL of the Google speech recognition API."""
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+"""The API key of the Google speech recognition API. If empty, requests are
+made by SpeechRecognition with its default key, without pooled connections."""
+upload_codec = "flac"
+"""The codec of uploaded audio."""
+upload_stats = {"uploads": 0, "raw_bytes": 0, "bytes": 0, "encode_ms": 0.0}
+"""The totals of the audio uploaded to the Whisper API: the number of
+uploads, the size of the audio before and after encoding, and the time spent
+encoding it."""
+_warm_engines: tuple = ()  # the engines and codec connections were opened for
+_upload_lock = threading.Lock()  # uploads are made from worker threads
+_engines_started = False  # whether the selected engines are run
+openai.requestssession = connections.session
 
 
-async def recognize(audio_data: sr.AudioData) -> str:
-    """Recognize audio data.
+async def recognize(
+    audio_data: sr.AudioData,
+    key: Hashable | None = None,
+    on_sent: Callable[[float], None] | None = None,
+) -> str | None:
+    """Recognize audio data. Requests are scheduled by the global scheduler.
 
     Args:
         audio_data (AudioData): The audio to recognize.
+        key (Hashable, optional): The key of the recognized audio (e.g. its
+            phrase). Newer requests with the same key supersede older ones.
+        on_sent (Callable[[float], None], optional): Called with the latency
+            of the request (seconds) if it was sent to the engines.
 
     Returns:
-        str: The transcription of the audio.
+        str | None: The transcription of the audio, or None if the request
+            was superseded or its result is stale.
     """
-    global recognizer, active_engine
+    return await scheduler.recognize(audio_data, key, on_sent)
 
-    try:
-        return await asyncio.to_thread(active_engine, audio_data)
-    except sr.UnknownValueError as e:
-        raise UnrecognizedAudioError from e
-    except sr.RequestError as e:
-        raise RecognitionEngineError from e
-    except Exception as e:
-        raise RecognitionEngineError from e
+
+class RecognitionScheduler:
+    """Schedules recognition requests to the active engine.
+
+    At most `max_in_flight` requests run at a time; the rest wait in order.
+    Requests are keyed by the audio they recognize. A waiting request is
+    superseded when a newer request with the same key is made, and a result
+    is stale when a newer request with the same key already completed.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.waiting = 0
+        """The number of requests waiting to run."""
+        self.in_flight = 0
+        """The number of requests running."""
+        self.superseded = 0
+        """The number of requests superseded before running."""
+        self.stale = 0
+        """The number of results dropped as stale."""
+        self.completed = 0
+        """The number of requests completed."""
+
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._submitted: dict[Hashable, int] = {}  # latest request by key
+        self._completed: dict[Hashable, int] = {}  # latest result by key
+        self._requests = 0  # number of requests made
+
+    async def recognize(
+        self,
+        audio_data: sr.AudioData,
+        key: Hashable | None = None,
+        on_sent: Callable[[float], None] | None = None,
+    ) -> str | None:
+        """Recognize audio data using the configured engines.
+
+        Args:
+            audio_data (AudioData): The audio to recognize.
+            key (Hashable, optional): The key of the recognized audio.
+            on_sent (Callable[[float], None], optional): Called with the
+                latency of the request (seconds) if it was sent.
+
+        Returns:
+            str | None: The transcription of the audio, or None if the request
+                was superseded or its result is stale.
+        """
+        self._requests += 1
+        request = self._requests
+        if key is not None:
+            self._submitted[key] = request
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        try:
+            if key is not None and self._submitted.get(key) != request:
+                self.superseded += 1
+                return None
+
+            self.in_flight += 1
+            start_time = time.perf_counter()
+            try:
+                result = await router.recognize(audio_data)
+            except sr.UnknownValueError as e:
+                raise UnrecognizedAudioError from e
+            except sr.RequestError as e:
+                raise RecognitionEngineError from e
+            except Exception as e:
+                raise RecognitionEngineError from e
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+                if on_sent is not None:
+                    on_sent(time.perf_counter() - start_time)
+        finally:
+            self._slots.release()
+
+        if key is not None:
+            if key not in self._submitted:  # forgotten while running
+                self.stale += 1
+                return None
+            if self._completed.get(key, 0) > request:
+                self.stale += 1
+                return None
+            self._completed[key] = request
+        return result
+
+    def forget(self, key: Hashable):
+        """Forget the requests of a key that is no longer recognized."""
+        self._submitted.pop(key, None)
+        self._completed.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        """The statistics of the scheduler."""
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "superseded": self.superseded,
+            "stale": self.stale,
+            "completed": self.completed,
+        }
 
 
 def _google_recognize(audio_data: sr.AudioData) -> str:
-    global recognizer
-    return recognizer.recognize_google(audio_data)  # type: ignore
+    if not GOOGLE_API_KEY:  # use SpeechRecognition's default key
+        return sr.Recognizer().recognize_google(audio_data)
+
+    # same request as SpeechRecognition's, over the shared connections
+    content_type = f"audio/x-flac; rate={UPLOAD_SAMPLE_RATE}"
+    try:
+        response = connections.session.post(
+            GOOGLE_API_URL,
+            params=dict(
+                client="chromium", lang="en-US", key=GOOGLE_API_KEY, pFilter=0
+            ),
+            data=audio_data.get_flac_data(UPLOAD_SAMPLE_RATE, 2),
+            headers={"Content-Type": content_type},
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise sr.RequestError(f"Recognition request failed: {e}") from e
+
+    # the response is a result per line, the first ones are empty
+    for line in response.text.splitlines():
+        if line and (results := json.loads(line)["result"]):
+            alternatives = results[0].get("alternative", [])
+            break
+    else:
+        raise sr.UnknownValueError()
+    if not alternatives:
+        raise sr.UnknownValueError()
+
+    # use the alternative with a confidence score, the best one, if any
+    best = next((a for a in alternatives if "confidence" in a), None)
+    return (best or alternatives[0])["transcript"]
 
 
 def _whisper_recognize(audio_data: sr.AudioData) -> str:
-    global recognizer
-    return recognizer.recognize_whisper_api(audio_data)  # type: ignore
+    start_time = time.perf_counter()
+    upload = io.BytesIO(_encode_upload(audio_data, upload_codec))
+    upload.name = f"audio.{'ogg' if upload_codec == 'opus' else upload_codec}"
+    encode_time = time.perf_counter() - start_time
+    with _upload_lock:
+        upload_stats["uploads"] += 1
+        upload_stats["raw_bytes"] += len(audio_data.frame_data)
+        upload_stats["bytes"] += len(upload.getbuffer())
+        upload_stats["encode_ms"] += encode_time * 1000
+
+    LOGGER.debug(
+        "Uploading %d bytes of %s audio (%d bytes raw), encoded in %.1fms",
+        len(upload.getbuffer()),
+        upload_codec,
+        len(audio_data.frame_data),
+        encode_time * 1000,
+    )
+    transcript = openai.Audio.transcribe("whisper-1", upload)
+    if not (text := transcript["text"]):  # type: ignore
+        raise sr.UnknownValueError()
+    return text
+
+
+def _encode_upload(audio_data: sr.AudioData, codec: str) -> bytes:
+    # downsample to the model's rate and encode to reduce the upload size
+    if codec == "flac":
+        return audio_data.get_flac_data(UPLOAD_SAMPLE_RATE, convert_width=2)
+    elif codec == "wav":
+        return audio_data.get_wav_data(UPLOAD_SAMPLE_RATE, convert_width=2)
+
+    pcm = audio_data.get_raw_data(UPLOAD_SAMPLE_RATE, convert_width=2)
+    ffmpeg = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        + ["-f", "s16le", "-ar", str(UPLOAD_SAMPLE_RATE), "-ac", "1"]
+        + ["-i", "pipe:0", "-c:a", "libopus", "-b:a", OPUS_BITRATE]
+        + ["-application", "voip", "-f", "ogg", "pipe:1"],
+        input=pcm,
+        capture_output=True,
+        check=True,
+    )
+    return ffmpeg.stdout
 
 
 class RecognitionEngineError(Exception):
@@ -71,21 +272,74 @@ class UnrecognizedAudioError(RecognitionEngineError):
 # CONFIGURATION ###############################################################
 
 
+ENGINES: dict[str, Callable[[sr.AudioData], str]] = {
+    "google": _google_recognize,
+    "whisper": _whisper_recognize,
+    "local": local.recognize,
+}
+"""The registry of recognition engines, by name."""
+
+
+def start_engines():
+    """Run the selected engines: start the local engine's workers and open
+    the connections of remote engines, and keep doing so as the selection
+    changes. Called when the application starts; until then, validating the
+    configuration only selects the engines."""
+    global _engines_started
+    _engines_started = True
+    _run_engines(configurator.config)
+
+
+def stop_engines():
+    """Stop the engines started by `start_engines`."""
+    global _engines_started, _warm_engines
+    _engines_started = False
+    _warm_engines = ()
+    local.stop()
+
+
 def validate_engine(config: Config):
-    global active_engine
-    engines = {
-        "google": _google_recognize,
-        "whisper": _whisper_recognize,
-    }
+    selected = {config.transcription_engine, config.secondary_engine} - {""}
+    for engine in selected:
+        if engine not in ENGINES:
+            raise ValueError(f"Invalid engine: {engine}")
+    if config.secondary_engine == config.transcription_engine:
+        raise ValueError("The secondary engine must differ from the primary")
+    router.configure(config.transcription_engine, config.secondary_engine)
+    if _engines_started:
+        _run_engines(config)
 
-    try:
-        active_engine = engines[config.transcription_engine]
-    except KeyError:
-        raise ValueError(f"Invalid engine: {config.transcription_engine}")
+
+def _run_engines(config: Config):
+    global _warm_engines
+    selected = {config.transcription_engine, config.secondary_engine} - {""}
+
+    # run the local engine only while it is selected
+    if "local" in selected:
+        local.start()
+    else:
+        local.stop()
+
+    # open the connections of remote engines ahead of the first requests
+    engines = (sorted(selected), config.upload_codec)
+    if engines == _warm_engines:
+        return  # the connections are already open
+    _warm_engines = engines
+    if "google" in selected and GOOGLE_API_KEY:
+        connections.warm_up(GOOGLE_API_URL, MAX_IN_FLIGHT)
+    if "whisper" in selected:
+        connections.warm_up(openai.api_base, MAX_IN_FLIGHT)
+
+
+def validate_upload_codec(config: Config):
+    global upload_codec
+    if config.upload_codec not in UPLOAD_CODECS:
+        raise ValueError(f"Invalid upload codec: {config.upload_codec}")
+    upload_codec = config.upload_codec
 
 
 def validate_api_key(config: Config):
-    global OPENAI_API_KEY, recognizer
+    global OPENAI_API_KEY
     openai.api_key = config.openai_api_key
     os.environ["OPENAI_API_KEY"] = config.openai_api_key
 
@@ -95,5 +349,11 @@ def validate_api_key(config: Config):
         LOGGER.error("Invalid OpenAI API key")
 
 
+router = EngineRouter(ENGINES)
+"""The global recognition engine router."""
+scheduler = RecognitionScheduler(MAX_IN_FLIGHT)
+"""The global recognition scheduler."""
+
 register_validator(validate_engine)
+register_validator(validate_upload_codec)
 register_validator(validate_api_key)
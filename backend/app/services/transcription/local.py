@@ -0,0 +1,151 @@
+"""
+Local speech recognition engine.
+
+Runs an offline speech recognition model in a pool of worker processes, so
+recognition doesn't depend on the network and runs on the other cores of the
+device instead of competing with the event loop. Each worker loads the model
+once, when it starts. Workers are started by a fork server (or spawned where
+it's unavailable), since forking the running, multi-threaded application can
+deadlock, and all of them are started and loaded when the engine starts. The
+workers run the `local_recognition` module, which doesn't import the
+application.
+
+Requests beyond the number of workers wait for a free worker instead of
+queuing in the pool, so that requests that timed out, which can't be
+interrupted, still hold their worker until they finish.
+
+Supported models (`LOCAL_MODEL` environment variable):
+
+- `stub`: A deterministic stand-in model, used for tests and benchmarks.
+- `vosk:<model path>`: A Vosk model (requires `vosk`).
+- `whisper:<model name>`: An OpenAI Whisper model, such as `whisper:tiny`
+  (requires `openai-whisper`).
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import local_recognition
+import speech_recognition as sr  # type: ignore
+
+from . import LOGGER
+
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "stub")
+"""The local recognition model."""
+LOCAL_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+"""The number of worker processes running the model."""
+LOCAL_TIMEOUT = 10
+"""The maximum duration of a recognition request (seconds)."""
+
+_executor: ProcessPoolExecutor | None = None  # the worker processes pool
+_workers: threading.Semaphore | None = None  # the pool's free workers
+_MODEL_SAMPLE_RATE = local_recognition.MODEL_SAMPLE_RATE
+
+
+def start(model: str = LOCAL_MODEL):
+    """Start the worker processes and warm them up in the background.
+
+    Args:
+        model (str, optional): The model to load. Defaults to LOCAL_MODEL.
+    """
+    global _executor, _workers
+    if _executor is not None:
+        return
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # preload the workers' module instead of the application's main one
+        context.set_forkserver_preload(["local_recognition"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    _executor = ProcessPoolExecutor(
+        LOCAL_WORKERS,
+        mp_context=context,
+        initializer=local_recognition.load_model,
+        initargs=(model,),
+    )
+    _workers = threading.Semaphore(LOCAL_WORKERS)
+    warmup = bytes(_MODEL_SAMPLE_RATE * 2)  # 1 second of silence
+    for _ in range(LOCAL_WORKERS):  # start and load every worker
+        _workers.acquire()
+        future = _submit(_executor, _workers, warmup, _MODEL_SAMPLE_RATE, 2)
+        future.add_done_callback(_log_warmup)
+    LOGGER.info("Local recognition engine starting: %s", model)
+
+
+def stop():
+    """Stop the worker processes."""
+    global _executor, _workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = _workers = None
+        LOGGER.info("Local recognition engine stopped")
+
+
+def recognize(audio_data: sr.AudioData) -> str:
+    """Recognize audio data using the local model.
+
+    Args:
+        audio_data (AudioData): The audio to recognize.
+
+    Returns:
+        str: The transcription of the audio.
+
+    Raises:
+        sr.UnknownValueError: If no speech was recognized.
+        sr.RequestError: If the engine is not running, is busy, or timed out.
+    """
+    executor, workers = _executor, _workers
+    if executor is None or workers is None:
+        raise sr.RequestError("Local recognition engine is not running")
+    if not workers.acquire(timeout=LOCAL_TIMEOUT):
+        raise sr.RequestError("Local recognition engine is busy")
+
+    try:
+        future = _submit(
+            executor,
+            workers,
+            audio_data.get_raw_data(convert_width=2),
+            audio_data.sample_rate,
+            2,
+        )
+        transcript = future.result(timeout=LOCAL_TIMEOUT)
+    except FutureTimeoutError as e:  # the worker is freed once it finishes
+        raise sr.RequestError("Local recognition timed out") from e
+    except RuntimeError as e:  # stopped while waiting for a worker
+        raise sr.RequestError("Local recognition engine is not running") from e
+
+    if not transcript:
+        raise sr.UnknownValueError()
+    return transcript
+
+
+def _submit(
+    executor: ProcessPoolExecutor,
+    workers: threading.Semaphore,
+    data: bytes,
+    sample_rate: int,
+    sample_width: int,
+) -> Future:
+    # run a request on an acquired worker, freed when the request finishes
+    try:
+        future = executor.submit(
+            local_recognition.recognize, data, sample_rate, sample_width
+        )
+    except BaseException:
+        workers.release()
+        raise
+    future.add_done_callback(lambda _: workers.release())
+    return future
+
+
+def _log_warmup(future: Future):
+    if future.cancelled():
+        return
+    elif error := future.exception():
+        LOGGER.error("Local recognition engine failed to start: %s", error)
+    else:
+        LOGGER.debug("Local recognition worker ready")
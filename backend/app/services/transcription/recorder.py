@@ -1,12 +1,17 @@
-import asyncio
-import queue
+"""
+Speech recorder. Segments microphone audio into recordings of speech using
+the energy of the audio, following the same algorithm and thresholds as the
+SpeechRecognition library's recognizer, without a polling thread.
+"""
 
-import speech_recognition as sr
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
 
 from ...models.microphone import MicrophoneConfig
-from ..events import Event, EventHandler
-from . import LOGGER
-from .engines import recognizer
+from ..events import Event, EventHandler, OverflowPolicy
+from . import LOGGER, calibration
 
 RECORD_TIMEOUT = 0.5
 """The maximum audio recording chunk size (seconds)."""
@@ -14,48 +19,78 @@ ENERGY_THRESHOLD = 1000
 """The energy threshold for recording audio."""
 DYNAMIC_ENERGY_THRESHOLD = True
 """Whether to dynamically adjust the energy threshold for recording audio."""
-
-recording_loop = asyncio.get_event_loop()
-"""Global recording event loop."""
+MAX_QUEUED_CHUNKS = 64
+"""The maximum number of audio chunks waiting to be segmented."""
+
+CALIBRATION_DURATION = 1
+"""The duration of the initial audio used to adjust for ambient noise, while
+speech is already being recorded (seconds)."""
+PAUSE_THRESHOLD = 0.8
+"""The duration of non-speaking audio that ends speech (seconds)."""
+PHRASE_THRESHOLD = 0.3
+"""The minimum duration of speech that is recorded (seconds)."""
+PRE_ROLL_DURATION = 0.5
+"""The duration of non-speaking audio kept before speech (seconds)."""
+DYNAMIC_ENERGY_DAMPING = 0.15
+"""The damping of the dynamic energy threshold adjustments, per second."""
+DYNAMIC_ENERGY_RATIO = 1.5
+"""The ratio of the energy threshold to the ambient noise energy."""
+_BLOCK_DURATION = 0.02  # duration of audio blocks analyzed at a time (s)
+
+
+@dataclass
+class SpeechSegment:
+    """A recording of speech."""
+
+    data: bytes
+    """The recorded audio."""
+    start: int
+    """The offset of the first sample of the recording in the audio stream."""
+    end: int
+    """The offset after the last sample of the recording in the stream."""
+    final: bool
+    """Whether the recording ends the speech (followed by a pause)."""
 
 
 async def start_recorder(mic_config: MicrophoneConfig, mic_event: Event):
-    """Start recording audio from a microphone using a speech recognition
-    engine.
+    """Start recording speech from a microphone.
 
     Args:
-        engine (RecognitionEngine): The speech recognition engine.
         mic_config (MicrophoneConfig): The microphone configuration.
         mic_event (Event): The audio event triggered on new microphone data.
 
     Returns:
-        Tuple[Event[sr.AudioData], CancellationToken]: The recording event and
-            the cancellation token.
+        Tuple[Event[SpeechSegment], CancellationToken]: The recording event
+            and the cancellation token.
     """
 
-    # configure the engine's recognizer
-    recognizer.energy_threshold = ENERGY_THRESHOLD
-    recognizer.dynamic_energy_threshold = DYNAMIC_ENERGY_THRESHOLD
-
-    # listen to the microphone
-    source = BufferedAudioSource(mic_config)
-    await mic_event.subscribe(source.audio_handler)
-    await mic_event.until_triggered()  # wait for first audio packet
-    await _adjust_for_ambient_noise(source)  # adjust for ambient noise
-
-    # start recording in the background
-    recording_event = Event[sr.AudioData]()
-    recording_stopper = recognizer.listen_in_background(
-        source,
-        _create_trigger_wrapper(recording_event),
-        phrase_time_limit=RECORD_TIMEOUT,
+    # segment the microphone audio, starting from the cached calibration
+    recording_event = Event[SpeechSegment]()
+    segmenter = SpeechSegmenter(
+        mic_config,
+        recording_event,
+        calibration.get_threshold(mic_config.device_id),
+    )
+    audio_handler = EventHandler(
+        segmenter.process,
+        sequential=True,
+        timeout=None,
+        max_queue_size=MAX_QUEUED_CHUNKS,
+        overflow_policy=OverflowPolicy.DROP_OLDEST,
     )
+    await mic_event.subscribe(audio_handler)
 
     # stop recording when cancelled
     async def stop():
-        nonlocal recording_stopper, mic_event
-        recording_stopper()
-        await mic_event.unsubscribe(source.audio_handler)
+        await mic_event.unsubscribe(audio_handler)
+        if segmenter.calibrated:  # cache the calibration for new sessions
+            calibration.store_threshold(
+                mic_config.device_id, segmenter.energy_threshold
+            )
+        if audio_handler.dropped:
+            LOGGER.warning(
+                "Recorder dropped %d audio chunks", audio_handler.dropped
+            )
         LOGGER.debug("Transcription recording stopped")
 
     cancellation_event = Event()
@@ -64,60 +99,144 @@ async def start_recorder(mic_config: MicrophoneConfig, mic_event: Event):
     return recording_event, cancellation_event
 
 
-def _create_trigger_wrapper(event: Event):
-    def trigger_wrapper(_, audio_data: sr.AudioData):
-        global recording_loop
-
-        async def async_wrapper():
-            await event.trigger(audio_data)
-
-        asyncio.run_coroutine_threadsafe(async_wrapper(), recording_loop)
-
-    return trigger_wrapper
-
-
-async def _adjust_for_ambient_noise(source: "BufferedAudioSource"):
-    with source:  # adjust for ambient noise
-        LOGGER.info("Adjusting recognizer for ambient noise")
-        await recording_loop.run_in_executor(
-            None, recognizer.adjust_for_ambient_noise, source
+class SpeechSegmenter:
+    """Segments audio into recordings of speech. Audio is analyzed in blocks
+    whose energy is compared against an energy threshold. The threshold is
+    adjusted for ambient noise using the first `CALIBRATION_DURATION` of
+    audio, whether or not it exceeds the initial threshold, while speech is
+    already being recorded. Recordings are emitted every `RECORD_TIMEOUT`
+    seconds while speech continues, with `PRE_ROLL_DURATION` of the
+    preceding audio kept before speech starts."""
+
+    def __init__(
+        self,
+        mic_config: MicrophoneConfig,
+        event: Event,
+        energy_threshold: float | None = None,
+    ):
+        """
+        Args:
+            mic_config (MicrophoneConfig): The configuration of the audio.
+            event (Event[SpeechSegment]): The event triggered with recordings.
+            energy_threshold (float, optional): The initial energy threshold,
+                such as a previous calibration. Defaults to ENERGY_THRESHOLD.
+        """
+        self.energy_threshold: float = energy_threshold or ENERGY_THRESHOLD
+        """The energy threshold of speech."""
+        self.dynamic_energy_threshold = DYNAMIC_ENERGY_THRESHOLD
+        """Whether to adjust the energy threshold to ambient noise."""
+
+        self._event = event
+        self._sample_type = np.dtype(f"<i{mic_config.sample_width}")
+        self._frame_size = mic_config.sample_width * mic_config.num_channels
+        self._byte_rate = mic_config.sample_rate * self._frame_size
+        self._block_frames = max(
+            int(mic_config.sample_rate * _BLOCK_DURATION), 1
         )
-        LOGGER.info("Recognizer adjusted")
-
-
-class BufferedAudioSource(sr.AudioSource):
-    def __init__(self, mic_config: MicrophoneConfig):
-        self.stream = self.AudioStream(mic_config)
-        self.audio_handler = EventHandler(self.stream.write, sequential=True)
-
-        self.SAMPLE_RATE = mic_config.sample_rate
-        self.SAMPLE_WIDTH = mic_config.sample_width
-        self.CHUNK = mic_config.chunk_size
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        pass
-
-    class AudioStream(object):
-        def __init__(self, mic_config: MicrophoneConfig) -> None:
-            self.buffer = queue.Queue()
-            self.config = mic_config
-
-        def write(self, data: bytes):
-            for byte in data:
-                self.buffer.put(byte)
-
-        def read(self, size: int) -> bytes:
-            data = bytearray()
-            num_bytes = (
-                size * self.config.sample_width * self.config.num_channels
+        self._block_size = self._block_frames * self._frame_size
+        self._damping = DYNAMIC_ENERGY_DAMPING**_BLOCK_DURATION
+
+        self._pending = bytearray()  # audio smaller than a block
+        self._offset = 0  # offset of the pending audio in the stream
+        self._calibration = int(CALIBRATION_DURATION / _BLOCK_DURATION)
+        # number of blocks left to adjust for ambient noise
+        self._pre_roll: deque[bytes] = deque(
+            maxlen=max(int(PRE_ROLL_DURATION / _BLOCK_DURATION), 1)
+        )  # non-speaking blocks preceding speech
+
+        self._recording = bytearray()  # the recording being made
+        self._recording_start = 0  # offset of the recording in the stream
+        self._speaking = False  # whether speech is being recorded
+        self._speech_blocks = 0  # number of speaking blocks of the speech
+        self._pause_blocks = 0  # number of consecutive non-speaking blocks
+        self._emitted = False  # whether the speech was partially emitted
+
+    async def process(self, data: bytes):
+        """Process audio from the stream."""
+        self._pending += data
+        count = len(self._pending) // self._block_size
+        if count == 0:
+            return
+
+        size = count * self._block_size
+        audio = bytes(self._pending[:size])
+        del self._pending[:size]
+        samples = np.frombuffer(audio, self._sample_type).reshape(count, -1)
+        energies = np.sqrt(np.mean(np.square(samples, dtype=np.float64), 1))
+
+        for index, energy in enumerate(energies.tolist()):
+            start = index * self._block_size
+            block = audio[start : start + self._block_size]
+            await self._process_block(block, energy)
+            self._offset += self._block_frames
+            self._update_threshold(energy)
+
+    async def _process_block(self, block: bytes, energy: float):
+        speech = energy > self.energy_threshold
+        if not self._speaking:
+            self._pre_roll.append(block)
+            if not speech:
+                return
+            # speech started, include the preceding audio
+            self._speaking = True
+            self._recording = bytearray().join(self._pre_roll)
+            self._recording_start = self._offset + self._block_frames - (
+                len(self._pre_roll) * self._block_frames
             )
-
-            for _ in range(num_bytes):
-                try:  # stop if no data is available for 0.5 seconds
-                    data.append(self.buffer.get(timeout=0.5))
-                except queue.Empty:
-                    return b""
-            return data
+            self._pre_roll.clear()
+            self._speech_blocks = self._pause_blocks = 0
+            self._emitted = False
+        else:
+            self._recording += block
+
+        self._speech_blocks += 1
+        self._pause_blocks = 0 if speech else self._pause_blocks + 1
+        if self._pause_blocks * _BLOCK_DURATION > PAUSE_THRESHOLD:
+            await self._emit(final=True)  # speech ended
+        elif len(self._recording) >= RECORD_TIMEOUT * self._byte_rate:
+            await self._emit(final=False)
+
+    async def _emit(self, final: bool):
+        speech_duration = (
+            self._speech_blocks - self._pause_blocks
+        ) * _BLOCK_DURATION
+        if final:
+            self._speaking = False
+            if not self._emitted and speech_duration < PHRASE_THRESHOLD:
+                self._recording = bytearray()
+                return  # too short to be speech
+
+        frames = len(self._recording) // self._frame_size
+        segment = SpeechSegment(
+            bytes(self._recording),
+            self._recording_start,
+            self._recording_start + frames,
+            final,
+        )
+        self._recording = bytearray()
+        self._recording_start = segment.end
+        self._emitted = True
+        await self._event.trigger(segment)
+
+    @property
+    def calibrated(self) -> bool:
+        """Whether the threshold was adjusted for ambient noise."""
+        return not self._calibration
+
+    def _update_threshold(self, energy: float):
+        # adjust the threshold to ambient noise, which can exceed the initial
+        # threshold, then only when there is no speech
+        if self._calibration:
+            self._calibration -= 1
+            if not self._calibration:
+                LOGGER.info(
+                    "Recorder adjusted, energy threshold: %.0f",
+                    self.energy_threshold,
+                )
+        elif self._speaking or not self.dynamic_energy_threshold:
+            return
+
+        target = energy * DYNAMIC_ENERGY_RATIO
+        self.energy_threshold = self.energy_threshold * self._damping + (
+            target * (1 - self._damping)
+        )
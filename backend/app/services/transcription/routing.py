@@ -0,0 +1,255 @@
+"""
+Recognition engine routing.
+
+Routes recognition requests between a primary and an optional secondary
+engine. The latency and errors of each engine are tracked over its recent
+requests. A request that takes longer than the primary's 95th percentile
+latency is hedged: the same audio is sent to the secondary engine and the
+first result is used. An engine that keeps failing is taken out of rotation
+(its circuit is opened) for a cooldown, after which it is tried again.
+
+Engines run in worker threads, which can't be interrupted. The request whose
+result isn't used is abandoned and left to finish in its thread, recording
+its outcome; hedging is paused while `MAX_ABANDONED` requests are running.
+"""
+
+import asyncio
+import statistics
+import time
+from collections import deque
+from collections.abc import Callable
+
+import speech_recognition as sr  # type: ignore
+
+from . import LOGGER
+
+LATENCY_WINDOW = 50
+"""The number of recent requests used to estimate the latency of engines."""
+ERROR_WINDOW = 20
+"""The number of recent requests used to estimate the error rate of engines."""
+MIN_SAMPLES = 5
+"""The minimum number of requests before the estimates are used."""
+MAX_ERROR_RATE = 0.5
+"""The error rate at which an engine is taken out of rotation."""
+COOLDOWN = 30
+"""The duration an engine is out of rotation before it is retried (seconds)."""
+HEDGE_DELAY = 2.0
+"""The hedging delay used until the latency of the primary is estimated
+(seconds)."""
+MAX_ABANDONED = 4
+"""The maximum number of abandoned requests still running, above which
+requests are no longer hedged."""
+
+
+class EngineHealth:
+    """The recent latency and errors of a recognition engine."""
+
+    def __init__(self):
+        self.requests = 0
+        """The number of requests made to the engine."""
+        self.errors = 0
+        """The number of requests that failed."""
+        self.open_until = 0.0
+        """The monotonic time until which the engine is out of rotation."""
+
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._outcomes: deque[bool] = deque(maxlen=ERROR_WINDOW)
+
+    @property
+    def available(self) -> bool:
+        """Whether the engine is in rotation (its circuit is closed)."""
+        return time.monotonic() >= self.open_until
+
+    @property
+    def error_rate(self) -> float:
+        """The rate of recent requests that failed."""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def percentile(self, percentile: int) -> float | None:
+        """The percentile of the recent latencies of the engine (seconds), or
+        None if too few requests were made."""
+        if len(self._latencies) < MIN_SAMPLES:
+            return None
+        return statistics.quantiles(self._latencies, n=100)[percentile - 1]
+
+    def record(self, latency: float, success: bool):
+        """Record the outcome of a request, opening the circuit of the engine
+        if it keeps failing.
+
+        Args:
+            latency (float): The duration of the request (seconds).
+            success (bool): Whether the request succeeded.
+        """
+        recovering = self.open_until > 0
+        self.requests += 1
+        self._latencies.append(latency)
+        self._outcomes.append(success)
+
+        if success:
+            if recovering:  # the engine recovered, forget its failures
+                self.open_until = 0.0
+                self._outcomes.clear()
+            return
+
+        self.errors += 1
+        if recovering or (
+            len(self._outcomes) >= MIN_SAMPLES
+            and self.error_rate >= MAX_ERROR_RATE
+        ):
+            self.open_until = time.monotonic() + COOLDOWN
+
+    def stats(self) -> dict:
+        """The statistics of the engine."""
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "state": "closed" if self.available else "open",
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "p50_ms": None if p50 is None else round(p50 * 1000),
+            "p95_ms": None if p95 is None else round(p95 * 1000),
+        }
+
+
+class EngineRouter:
+    """Routes recognition requests between a primary and a secondary engine,
+    hedging slow requests and failing over from failing engines."""
+
+    def __init__(self, engines: dict[str, Callable[[sr.AudioData], str]]):
+        """
+        Args:
+            engines (dict[str, Callable]): The recognition engines, by name.
+        """
+        self.primary = ""
+        """The name of the primary engine."""
+        self.secondary = ""
+        """The name of the secondary engine. Empty if disabled."""
+        self.hedged = 0
+        """The number of requests hedged to the secondary engine."""
+        self.hedges_won = 0
+        """The number of hedged requests answered first by the hedge."""
+        self.failovers = 0
+        """The number of requests sent to the secondary engine because the
+        primary failed or was out of rotation."""
+
+        self._engines = engines
+        self._health: dict[str, EngineHealth] = {}
+        self._abandoned: set[asyncio.Task] = set()  # results not needed
+
+    def configure(self, primary: str, secondary: str = ""):
+        """Set the engines requests are routed to.
+
+        Args:
+            primary (str): The name of the primary engine.
+            secondary (str, optional): The name of the secondary engine.
+                Defaults to none.
+        """
+        self.primary, self.secondary = primary, secondary
+        for name in filter(None, (primary, secondary)):
+            self._health.setdefault(name, EngineHealth())
+
+    async def recognize(self, audio_data: sr.AudioData) -> str:
+        """Recognize audio data using the configured engines.
+
+        Args:
+            audio_data (AudioData): The audio to recognize.
+
+        Returns:
+            str: The transcription of the audio.
+
+        Raises:
+            sr.UnknownValueError: If no speech was recognized.
+            Exception: The error of the last engine that failed.
+        """
+        primary, secondary = self.primary, self.secondary
+        if not secondary:
+            return await self._run(primary, audio_data)
+        if not self._health[primary].available:
+            if self._health[secondary].available:  # fail over
+                self.failovers += 1
+                primary, secondary = secondary, primary
+        if not self._health[secondary].available:
+            secondary = ""  # only the primary is in rotation
+
+        first = asyncio.create_task(self._run(primary, audio_data))
+        if not secondary:
+            return await first
+        try:
+            delay = self._health[primary].percentile(95) or HEDGE_DELAY
+            await asyncio.wait_for(asyncio.shield(first), delay)
+        except asyncio.TimeoutError:  # slow, hedge the request
+            pass
+        except sr.UnknownValueError:
+            raise
+        except asyncio.CancelledError:
+            self._abandon(first)
+            raise
+        except Exception as e:  # failed, fail over
+            LOGGER.warning("Recognition engine %s failed: %s", primary, e)
+            if not self._health[secondary].available:
+                raise
+            self.failovers += 1
+            return await self._run(secondary, audio_data)
+        else:
+            return first.result()
+
+        if (
+            not self._health[secondary].available
+            or len(self._abandoned) >= MAX_ABANDONED
+        ):
+            return await first  # don't hedge
+        self.hedged += 1
+
+        second = asyncio.create_task(self._run(secondary, audio_data))
+        pending = {first, second}
+        try:
+            while True:  # use the first successful result
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [task for task in done if not task.exception()]
+                if succeeded or not pending:
+                    task = (succeeded or list(done))[0]
+                    if task is second:
+                        self.hedges_won += 1
+                    return task.result()
+        finally:
+            for task in pending:  # the result is no longer needed
+                self._abandon(task)
+
+    def stats(self) -> dict:
+        """The statistics of the router and its engines."""
+        return {
+            "primary": self.primary,
+            "secondary": self.secondary,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won,
+            "failovers": self.failovers,
+            "engines": {
+                name: health.stats() for name, health in self._health.items()
+            },
+        }
+
+    def _abandon(self, task: asyncio.Task):
+        # let a request finish in its thread, its result is not needed
+        self._abandoned.add(task)
+        task.add_done_callback(self._abandoned.discard)
+        task.add_done_callback(
+            lambda task: task.cancelled() or task.exception()
+        )
+
+    async def _run(self, name: str, audio_data: sr.AudioData) -> str:
+        health = self._health[name]
+        start_time = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(self._engines[name], audio_data)
+        except sr.UnknownValueError:  # the engine responded, no speech
+            health.record(time.perf_counter() - start_time, True)
+            raise
+        except Exception:
+            health.record(time.perf_counter() - start_time, False)
+            raise
+        health.record(time.perf_counter() - start_time, True)
+        return result
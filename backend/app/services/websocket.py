@@ -10,7 +10,7 @@ import asyncio
 import logging
 from typing import Any, TypeVar
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket, WebSocketDisconnect, status
 from fastapi.websockets import WebSocketState
 
 from .events import Event, EventHandler
@@ -66,6 +66,10 @@ class WebSocketConnection:
         """Receive bytes from the WebSocket."""
         return await self._receive(self._websocket.receive_bytes) or b""
 
+    async def receive_text(self) -> str:
+        """Receive text from the WebSocket."""
+        return await self._receive(self._websocket.receive_text) or ""
+
     async def receive_obj(self, cls: type[T]) -> T:
         """Receive an object from the WebSocket."""
         try:
@@ -85,14 +89,23 @@ class WebSocketConnection:
             await self.disconnection_event()
             raise
 
-    async def disconnect(self):
-        """Disconnect the WebSocket."""
+    async def disconnect(
+        self,
+        code: int = status.WS_1000_NORMAL_CLOSURE,
+        reason: str | None = None,
+    ):
+        """Disconnect the WebSocket.
+
+        Args:
+            code (int, optional): The close code. Defaults to normal closure.
+            reason (str, optional): The reason of the closure.
+        """
         if self._websocket.state != WebSocketState.CONNECTED:
             await self.disconnection_event()
             return  # already disconnected
 
         try:
-            await self._websocket.close()
+            await self._websocket.close(code, reason)
         except Exception as e:
             LOGGER.exception(e)
         finally:
@@ -0,0 +1,9 @@
+"""
+Microbenchmarks of the backend's hot paths.
+
+Each module is a standalone script run from the backend directory:
+
+```sh
+python -m benchmarks.<module>
+```
+"""
@@ -0,0 +1,150 @@
+"""
+Recorder audio intake benchmark.
+
+Compares the recorder's audio intake, a sequential event handler passing
+whole chunks to the speech segmenter, against the previous per-byte queue
+that a polling thread read recorder sized chunks from. Websocket sized chunks
+of audio are streamed through each as fast as they are consumed.
+"""
+
+import argparse
+import asyncio
+import queue
+import threading
+import time
+
+from app.models.microphone import MicrophoneConfig
+from app.services.events import Event, EventHandler
+from app.services.transcription.recorder import (
+    MAX_QUEUED_CHUNKS,
+    SpeechSegmenter,
+)
+
+SAMPLE_RATE = 48000
+"""The benchmark sample rate (48 kHz, as captured by the frontend)."""
+SAMPLE_WIDTH = 2
+"""The benchmark sample width, in bytes."""
+WRITE_SIZE = 9600
+"""The size of written chunks, in bytes (100 ms of audio)."""
+READ_FRAMES = 1024
+"""The number of frames read at a time."""
+
+
+class QueueStream:
+    """The previous per-byte queue audio stream."""
+
+    def __init__(self):
+        self.buffer = queue.Queue()
+
+    def write(self, data: bytes):
+        for byte in data:
+            self.buffer.put(byte)
+
+    def read(self, size: int) -> bytes:
+        data = bytearray()
+        for _ in range(size * SAMPLE_WIDTH):
+            try:
+                data.append(self.buffer.get(timeout=0.5))
+            except queue.Empty:
+                return b""
+        return data
+
+
+def run_queue(duration: float) -> float:
+    """Stream an amount of audio through the per-byte queue.
+
+    Args:
+        duration (float): The duration of audio to stream (seconds).
+
+    Returns:
+        float: The elapsed wall time (seconds).
+    """
+    total = int(duration * SAMPLE_RATE * SAMPLE_WIDTH)
+    total -= total % (READ_FRAMES * SAMPLE_WIDTH)
+    chunk = bytes(WRITE_SIZE)
+    stream = QueueStream()
+
+    def produce():
+        written = 0
+        while written < total:
+            stream.write(chunk[: total - written])
+            written += min(WRITE_SIZE, total - written)
+
+    def consume():
+        read = 0
+        while read < total:
+            data = stream.read(READ_FRAMES)
+            if not data and not producer.is_alive():
+                break
+            read += len(data)
+
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce)
+    consumer = threading.Thread(target=consume)
+    producer.start()
+    consumer.start()
+    producer.join()
+    consumer.join()
+    return time.perf_counter() - start
+
+
+async def run_segmenter(duration: float) -> float:
+    """Stream an amount of audio through the recorder's speech segmenter.
+
+    Args:
+        duration (float): The duration of audio to stream (seconds).
+
+    Returns:
+        float: The elapsed wall time (seconds).
+    """
+    total = int(duration * SAMPLE_RATE * SAMPLE_WIDTH)
+    chunk = bytes(WRITE_SIZE)
+    segmenter = SpeechSegmenter(
+        MicrophoneConfig(SAMPLE_RATE, SAMPLE_WIDTH), Event()
+    )
+    processed = 0
+    done = asyncio.Event()
+
+    async def process(data: bytes):
+        nonlocal processed
+        await segmenter.process(data)
+        processed += len(data)
+        if processed >= total:
+            done.set()
+
+    mic_event = Event[bytes]()
+    await mic_event.subscribe(  # block instead of dropping audio
+        EventHandler(
+            process,
+            sequential=True,
+            timeout=None,
+            max_queue_size=MAX_QUEUED_CHUNKS,
+        )
+    )
+
+    start = time.perf_counter()
+    written = 0
+    while written < total:
+        await mic_event.trigger(chunk[: total - written])
+        written += min(WRITE_SIZE, total - written)
+    await done.wait()
+    return time.perf_counter() - start
+
+
+def main(duration: float):
+    for name, elapsed in (
+        ("queue", run_queue(duration)),
+        ("events", asyncio.run(run_segmenter(duration))),
+    ):
+        print(
+            f"{name:>6}: {duration:.0f}s of audio in {elapsed:.3f}s "
+            f"({duration / elapsed:,.0f}x real time)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-d", "--duration", type=float, default=5, help="audio seconds"
+    )
+    main(parser.parse_args().duration)
@@ -0,0 +1,99 @@
+"""
+Broadcast fan-out benchmark.
+
+Measures the time to deliver transcript-sized messages to an increasing number
+of WebSocket clients through a broadcast hub, with one client too slow to keep
+up. Clients are simulated, so only the hub's own overhead is measured.
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import WebSocketDisconnect
+
+from app.services.broadcast import BroadcastHub
+
+CLIENTS = (10, 50, 100)
+"""The numbers of clients to benchmark."""
+MESSAGE = {
+    "phrase_id": 1,
+    "revision": 1,
+    "stable_length": 64,
+    "text": "the changed suffix of a phrase",
+    "start": 12.5,
+    "end": 17.0,
+    "final": False,
+}
+"""A transcript-sized message."""
+
+
+class SimulatedClient:
+    """A WebSocket client that receives messages after a delay."""
+
+    def __init__(self, delay: float = 0):
+        self.received = 0
+        self.closed = asyncio.Event()
+        self._delay = delay
+
+    async def send(self, _):
+        await asyncio.sleep(self._delay)
+        self.received += 1
+
+    async def receive_text(self) -> str:
+        await self.closed.wait()
+        raise WebSocketDisconnect
+
+    async def disconnect(self):
+        self.closed.set()
+
+
+async def run(num_clients: int, num_messages: int) -> tuple[float, int]:
+    """Broadcast messages to clients, one of which is slow.
+
+    Args:
+        num_clients (int): The number of clients.
+        num_messages (int): The number of messages.
+
+    Returns:
+        tuple[float, int]: The number of messages delivered per second and
+            the number of evicted clients.
+    """
+    hub = BroadcastHub("Benchmark")
+    clients = [SimulatedClient() for _ in range(num_clients - 1)]
+    clients.append(SimulatedClient(delay=1))  # too slow to keep up
+    servers = [
+        asyncio.create_task(hub.serve(c)) for c in clients  # type: ignore
+    ]
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        hub.publish(MESSAGE)
+        await asyncio.sleep(0)  # let the clients be sent to
+    while sum(c.received for c in clients[:-1]) < (
+        num_messages * (num_clients - 1)
+    ):
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        await client.disconnect()
+    await asyncio.gather(*servers)
+    return hub.sent / elapsed, hub.evicted
+
+
+async def main(num_messages: int):
+    print(f"{'clients':>10}{'messages/s':>14}{'evicted':>10}")
+    for num_clients in CLIENTS:
+        rate, evicted = await run(num_clients, num_messages)
+        print(f"{num_clients:>10}{rate:>14,.0f}{evicted:>10}")
+    print("(messages delivered per second, over all clients)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-n", "--messages", type=int, default=1000, help="messages per run"
+    )
+    asyncio.run(main(parser.parse_args().messages))
@@ -0,0 +1,69 @@
+"""
+Event dispatch benchmark.
+
+Measures the number of event triggers per second for an increasing number of
+subscribers, for each kind of event handler.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.services.events import Event, EventHandler
+
+SUBSCRIBERS = (1, 4, 16)
+"""The numbers of subscribers to benchmark."""
+HANDLER_KINDS = {
+    "blocking": dict(blocking=True, timeout=None),
+    "blocking+timeout": dict(blocking=True),
+    "background": dict(timeout=None),
+    "background+timeout": dict(),
+    "sequential": dict(sequential=True, timeout=None),
+}
+"""The event handler options of each benchmarked kind of handler."""
+
+
+async def run(num_subscribers: int, options: dict, duration: float) -> float:
+    """Trigger an event repeatedly for a duration.
+
+    Args:
+        num_subscribers (int): The number of event subscribers.
+        options (dict): The event handler options.
+        duration (float): The duration of the benchmark (seconds).
+
+    Returns:
+        float: The number of triggers per second.
+    """
+    event = Event[bytes]()
+    for _ in range(num_subscribers):
+
+        async def callback(_: bytes):
+            pass
+
+        await event.subscribe(EventHandler(callback, **options))
+
+    data = bytes(1024)
+    triggers = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        for _ in range(100):
+            await event.trigger(data)
+        triggers += 100
+        await asyncio.sleep(0)  # let background handlers run
+    return triggers / elapsed
+
+
+async def main(duration: float):
+    print(f"{'handler':>20}" + "".join(f"{n:>12}" for n in SUBSCRIBERS))
+    for kind, options in HANDLER_KINDS.items():
+        rates = [await run(n, options, duration) for n in SUBSCRIBERS]
+        print(f"{kind:>20}" + "".join(f"{rate:>12,.0f}" for rate in rates))
+    print("(triggers per second, by number of subscribers)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-d", "--duration", type=float, default=1, help="seconds per run"
+    )
+    asyncio.run(main(parser.parse_args().duration))
@@ -0,0 +1,112 @@
+"""
+HTTP connection pool benchmark.
+
+Measures the latency of recognition-sized requests to a local stand-in server,
+opening a new connection per request versus reusing the engines' pooled
+connections. Connection setup (TCP and TLS handshakes) is simulated by the
+server with a delay per new connection.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services.transcription import connections
+
+RESPONSE = b'{"result":[]}\n{"result":[{"alternative":[{"transcript":"x"}]}]}'
+"""The response of the stand-in server, shaped like a Google response."""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every request, after a delay for each new connection."""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    connection_delay = 0.0
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.connection_delay)  # simulated handshake
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *_):
+        pass
+
+
+def run(post, url: str, requests_count: int, payload: bytes) -> list[float]:
+    """Make requests sequentially.
+
+    Args:
+        post (Callable): The function making a POST request.
+        url (str): The URL of the server.
+        requests_count (int): The number of requests.
+        payload (bytes): The body of each request.
+
+    Returns:
+        list[float]: The latency of each request (seconds).
+    """
+    latencies = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        post(url, data=payload).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(requests_count: int, connection_delay: float, payload_size: int):
+    StandInHandler.connection_delay = connection_delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/recognize"
+    payload = bytes(payload_size)
+
+    session = connections.create_session()
+    runs = {
+        "new connection": requests.post,
+        "pooled": session.post,
+    }
+    print(f"{'':>16}{'mean':>10}{'p50':>10}{'p95':>10}")
+    for name, post in runs.items():
+        latencies = run(post, url, requests_count, payload)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(
+            f"{name:>16}"
+            f"{statistics.mean(latencies) * 1000:>10.2f}"
+            f"{statistics.median(latencies) * 1000:>10.2f}"
+            f"{p95 * 1000:>10.2f}"
+        )
+    print("(request latency, in milliseconds)")
+    session.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-n", "--requests", type=int, default=200, help="requests per run"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-delay",
+        type=float,
+        default=0.03,
+        help="simulated connection setup time (seconds)",
+    )
+    parser.add_argument(
+        "-s",
+        "--payload-size",
+        type=int,
+        default=16000,
+        help="request body size (bytes)",
+    )
+    args = parser.parse_args()
+    main(args.requests, args.connection_delay, args.payload_size)
@@ -0,0 +1,316 @@
+"""
+Offline replay of the transcription pipeline.
+
+Streams a WAV file, or the audio of an archived session, through the real
+player, recorder and transcription chain, recognized by the local engine's
+deterministic stub model, and reports the throughput of each stage and the
+end-to-end latency of transcripts. No browser, microphone or network is
+needed.
+
+Audio is either paced in real time, like a live microphone, or fed as fast as
+the pipeline accepts it: the next chunk is fed once the recorder has taken
+the previous one, so no audio is dropped. Phrases end at the pauses the
+recorder detects in the audio, so they are split the same way at any pace.
+
+```sh
+python -m benchmarks.replay recording.wav
+python -m benchmarks.replay --session <session id> --realtime
+```
+"""
+
+import argparse
+import asyncio
+import bisect
+import logging
+import statistics
+import time
+
+import speech_recognition as sr  # type: ignore
+
+from app.models.microphone import MicrophoneConfig
+from app.models.transcript import TranscriptDelta
+from app.services import transcription
+from app.services.audio import archive, microphones, player
+from app.services.audio.recordings import WAV_HEADER_SIZE
+from app.services.events import Event, EventHandler
+from app.services.transcription import engines, local
+
+ARCHIVE_READ_DURATION = 10
+"""The duration of archived audio read at a time (seconds)."""
+DEVICE_ID = "replay"
+"""The device of replayed audio, so that the recorder's calibration of real
+devices is kept."""
+SETTLE_TIME = 0.5
+"""The idle time after which the pipeline is considered drained (seconds)."""
+
+
+class Meter:
+    """Measures the audio fed to the pipeline and the transcripts it
+    produces."""
+
+    def __init__(self, mic_config: MicrophoneConfig):
+        self.chunks = 0
+        """The number of audio chunks fed."""
+        self.audio_time = 0.0
+        """The duration of the audio fed (seconds)."""
+        self.deltas = 0
+        """The number of transcript deltas produced."""
+        self.finals = 0
+        """The number of phrases finished."""
+        self.latencies: list[float] = []
+        """The end-to-end latency of each delta (seconds)."""
+
+        self._byte_rate = (
+            mic_config.sample_rate
+            * mic_config.sample_width
+            * mic_config.num_channels
+        )
+        self._fed_audio: list[float] = []  # audio fed after each chunk (s)
+        self._fed_times: list[float] = []  # time each chunk was fed
+
+    async def feed(self, data: bytes):
+        """Record a chunk of audio fed to the pipeline."""
+        self.chunks += 1
+        self.audio_time += len(data) / self._byte_rate
+        self._fed_audio.append(self.audio_time)
+        self._fed_times.append(time.perf_counter())
+
+    async def transcript(self, delta: TranscriptDelta):
+        """Record a transcript delta, measuring its latency from the time the
+        last audio it transcribes was fed."""
+        self.deltas += 1
+        self.finals += delta.final
+        chunk = bisect.bisect_left(self._fed_audio, delta.end - 1e-6)
+        if chunk < len(self._fed_times):
+            self.latencies.append(time.perf_counter() - self._fed_times[chunk])
+
+
+def open_archive(
+    session_id: str, chunk_size: int, realtime: bool, start: float
+):
+    """Create a microphone that returns the audio of an archived session.
+
+    Args:
+        session_id (str): The identifier of the archived session.
+        chunk_size (int): The number of frames per chunk.
+        realtime (bool): Whether to return chunks at the pace of the audio.
+        start (float): The time to start reading from (seconds).
+
+    Returns:
+        Callable[[], Coroutine[memoryview]]: The audio source.
+        MicrophoneConfig: The audio configuration.
+        CancelHandler: The cancellation handler.
+    """
+    index = archive.load_index(session_id)
+    info = index["session"]
+    config = MicrophoneConfig(
+        info["sample_rate"], info["sample_width"], info["num_channels"]
+    )
+    config.chunk_size = chunk_size
+    duration = index["duration"]
+    if duration is None and index["segments"]:  # interrupted session
+        duration = index["segments"][-1]["start"] + archive.SEGMENT_DURATION
+    chunk_bytes = chunk_size * config.sample_width * config.num_channels
+    chunk_duration = chunk_size / config.sample_rate
+    position = start  # start of the next window read (seconds)
+    window = memoryview(b"")  # audio read and not returned yet
+    due = 0.0  # time the next chunk is due, if paced
+
+    async def mic():
+        nonlocal position, window, due
+        if realtime:
+            now = time.monotonic()
+            due = max(due, now)
+            await asyncio.sleep(due - now)
+            due += chunk_duration
+        if not window:
+            if position >= (duration or 0):
+                raise asyncio.CancelledError  # end of the session
+            end = min(position + ARCHIVE_READ_DURATION, duration)
+            audio = await asyncio.to_thread(
+                archive.read_range, session_id, position, end
+            )
+            window, position = memoryview(audio)[WAV_HEADER_SIZE:], end
+        chunk, window = window[:chunk_bytes], window[chunk_bytes:]
+        return chunk
+
+    async def close():
+        window.release()
+
+    return mic, config, EventHandler(close, one_shot=True)
+
+
+async def replay(mic, mic_config: MicrophoneConfig, realtime: bool):
+    """Replay audio through the transcription pipeline until it's drained.
+
+    Args:
+        mic (Callable[[], Coroutine[bytes]]): The audio source.
+        mic_config (MicrophoneConfig): The audio configuration.
+        realtime (bool): Whether the audio source is paced in real time.
+
+    Returns:
+        Meter: The measurements of the replay.
+        dict: The durations of feeding and processing the audio (seconds),
+            and the recorder's and recognition scheduler's counters.
+    """
+    meter = Meter(mic_config)
+    started = asyncio.Event()
+
+    async def paced_mic():
+        await started.wait()
+        while not realtime and any(  # wait for the recorder to take audio
+            handler.queue_size for handler in audio_event.handlers
+        ):
+            await asyncio.sleep(0)
+        return await mic()
+
+    # start the pipeline, measuring its input and output
+    mic_config.device_id = DEVICE_ID
+    audio_event, player_token = await player.start_audio_player(paced_mic)
+    await audio_event.subscribe(EventHandler(meter.feed, blocking=True))
+    transcript_event, transcription_token = await transcription.start(
+        mic_config, audio_event
+    )
+    await transcript_event.subscribe(
+        EventHandler(meter.transcript, blocking=True)
+    )
+    recognition = engines.scheduler.stats()
+
+    start_time = time.perf_counter()
+    started.set()
+    await player_token.until_triggered()
+    fed_time = time.perf_counter()
+    await _drain(audio_event)
+    drained_time = time.perf_counter() - SETTLE_TIME
+
+    recorder = [h for h in audio_event.handlers if h.sequential]
+    results = {
+        "feed_time": fed_time - start_time,
+        "total_time": drained_time - start_time,
+        "recorder_chunks": sum(h.queued for h in recorder),
+        "recorder_dropped": sum(h.dropped for h in recorder),
+    }
+    for name, count in engines.scheduler.stats().items():
+        results[name] = count - recognition[name]
+    await transcription_token()
+    return meter, results
+
+
+def report(meter: Meter, results: dict, source: str, realtime: bool):
+    """Print the measurements of a replay."""
+    feed_time, total_time = results["feed_time"], results["total_time"]
+    health = engines.router.stats()["engines"].get("local", {})
+    pacing = "in real time" if realtime else "as fast as possible"
+    print(f"{source}: {meter.audio_time:.1f}s of audio, fed {pacing}")
+    print(f"{'':>14}{'count':>10}{'per second':>12}{'':>4}")
+    rows = [
+        ("feed", meter.chunks, feed_time, "chunks"),
+        ("recorder", results["recorder_chunks"], total_time, "chunks"),
+        ("recognition", results["completed"], total_time, "requests"),
+        ("transcription", meter.deltas, total_time, "deltas"),
+    ]
+    for name, count, duration, unit in rows:
+        print(f"{name:>14}{count:>10}{count / duration:>12.1f}    {unit}")
+
+    print(
+        f"\nfed at {meter.audio_time / feed_time:.1f}x real time, "
+        f"processed at {meter.audio_time / total_time:.1f}x real time"
+    )
+    print(
+        f"recorder dropped {results['recorder_dropped']} chunks; "
+        f"recognition superseded {results['superseded']} requests "
+        f"and dropped {results['stale']} stale results"
+    )
+    print(
+        f"recognition latency: p50 {health.get('p50_ms')}ms, "
+        f"p95 {health.get('p95_ms')}ms; {meter.finals} phrases finished"
+    )
+    if len(meter.latencies) >= 2:
+        latencies = sorted(latency * 1000 for latency in meter.latencies)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(
+            f"end-to-end latency: p50 {statistics.median(latencies):.0f}ms, "
+            f"p95 {p95:.0f}ms, max {latencies[-1]:.0f}ms"
+        )
+
+
+async def main(source: str | None, session: str | None, **options):
+    chunk_size, realtime = options["chunk_size"], options["realtime"]
+    if session is not None:
+        mic, config, mic_token = open_archive(
+            session, chunk_size, realtime, options["start"]
+        )
+    else:
+        assert source is not None
+        mic, config, mic_token = microphones.create_file_mic(
+            source, chunk_size, realtime, start=options["start"]
+        )
+
+    # recognize with the local engine only, once it's running
+    engines.router.configure("local")
+    local.start(options["model"])
+    warmup = sr.AudioData(bytes(config.sample_rate * 2), config.sample_rate, 2)
+    try:
+        await asyncio.to_thread(local.recognize, warmup)
+    except sr.UnknownValueError:
+        pass
+
+    try:
+        meter, results = await replay(mic, config, realtime)
+    finally:
+        await mic_token()
+        local.stop()
+    report(meter, results, session or source or "", realtime)
+
+
+async def _drain(audio_event: Event[bytes]):
+    # wait until the pipeline has been idle for the settle time
+    idle_since = time.perf_counter()
+    while time.perf_counter() - idle_since < SETTLE_TIME:
+        await asyncio.sleep(0.01)
+        stats = engines.scheduler.stats()
+        if (
+            stats["waiting"]
+            or stats["in_flight"]
+            or any(handler.queue_size for handler in audio_event.handlers)
+        ):
+            idle_since = time.perf_counter()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", nargs="?", help="the WAV file to replay")
+    parser.add_argument(
+        "-s", "--session", help="replay an archived session instead"
+    )
+    parser.add_argument(
+        "-r", "--realtime", action="store_true", help="pace in real time"
+    )
+    parser.add_argument(
+        "--start", type=float, default=0, help="start time (seconds)"
+    )
+    parser.add_argument(
+        "-c", "--chunk-size", type=int, default=1024, help="frames per chunk"
+    )
+    parser.add_argument(
+        "-m", "--model", default="stub", help="local recognition model"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log the pipeline"
+    )
+    args = parser.parse_args()
+    if (args.source is None) == (args.session is None):
+        parser.error("replay either a WAV file or an archived session")
+    if not args.verbose:
+        logging.getLogger("app").setLevel(logging.WARNING)
+
+    asyncio.run(
+        main(
+            args.source,
+            args.session,
+            realtime=args.realtime,
+            start=args.start,
+            chunk_size=args.chunk_size,
+            model=args.model,
+        )
+    )
@@ -0,0 +1,84 @@
+"""
+Worker processes of the local speech recognition engine.
+
+Loads an offline speech recognition model and recognizes audio with it. Used
+by the worker processes of `app.services.transcription.local`. This module is
+kept outside of the `app` package and imports nothing from it, so that
+starting a worker doesn't import (and initialize) the application.
+"""
+
+import json
+from typing import Any
+
+import numpy as np
+
+MODEL_SAMPLE_RATE = 16000
+"""The sample rate expected by the models."""
+
+_model: Any = None  # the model of the worker process
+_model_name = ""  # the name of the model of the worker process
+
+
+def load_model(model: str):
+    """Load the model of the worker process.
+
+    Args:
+        model (str): The model to load (see `LOCAL_MODEL`).
+
+    Raises:
+        ValueError: If the model is invalid.
+    """
+    global _model, _model_name
+    kind, _, argument = model.partition(":")
+
+    if kind == "stub":
+        _model = None
+    elif kind == "vosk":
+        import vosk  # type: ignore
+
+        vosk.SetLogLevel(-1)
+        _model = vosk.Model(argument)
+    elif kind == "whisper":
+        import whisper  # type: ignore
+
+        _model = whisper.load_model(argument or "tiny")
+    else:
+        raise ValueError(f"Invalid local model: {model}")
+    _model_name = kind
+
+
+def recognize(data: bytes, sample_rate: int, sample_width: int) -> str:
+    """Recognize audio using the model of the worker process.
+
+    Args:
+        data (bytes): The audio, as signed PCM samples.
+        sample_rate (int): The sample rate of the audio.
+        sample_width (int): The sample width of the audio, in bytes.
+
+    Returns:
+        str: The transcription of the audio, empty if none.
+    """
+    samples = np.frombuffer(data, np.dtype(f"<i{sample_width}"))
+    samples = _resample(samples, sample_rate, MODEL_SAMPLE_RATE)
+
+    if _model_name == "stub":  # a word per half second of speech
+        return " ".join(["speech"] * int(len(samples) / 8000))
+    elif _model_name == "vosk":
+        import vosk  # type: ignore
+
+        recognizer = vosk.KaldiRecognizer(_model, MODEL_SAMPLE_RATE)
+        recognizer.AcceptWaveform(samples.astype("<i2").tobytes())
+        return json.loads(recognizer.FinalResult()).get("text", "")
+    else:
+        scale = float(2 ** (8 * sample_width - 1))
+        audio = samples.astype(np.float32) / scale
+        return _model.transcribe(audio, fp16=False)["text"].strip()
+
+
+def _resample(samples: np.ndarray, rate: int, target_rate: int):
+    if rate == target_rate:
+        return samples
+    duration = len(samples) / rate
+    positions = np.arange(int(duration * target_rate)) * (rate / target_rate)
+    resampled = np.interp(positions, np.arange(len(samples)), samples)
+    return resampled.astype(samples.dtype)
@@ -15,6 +15,8 @@ LOGGER = logging.getLogger(__name__)
 HOST = "0.0.0.0"
 PORT = 443
 CERTIFICATE_PORT = 9600
+WS_PING_INTERVAL = 10  # seconds between websocket pings to clients
+WS_PING_TIMEOUT = 10  # seconds before unresponsive clients are disconnected
 ROOT_CA_DIR = (  # root CA path
     subprocess.check_output("mkcert -CAROOT", shell=True).decode().strip()
 )
@@ -60,6 +62,8 @@ def main(debug=False):
             ssl_keyfile=key_path,
             reload=debug,
             log_config=None,
+            ws_ping_interval=WS_PING_INTERVAL,
+            ws_ping_timeout=WS_PING_TIMEOUT,
         )
     except Exception as e:  # pylint: disable=broad-except
         LOGGER.exception(e)
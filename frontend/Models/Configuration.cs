@@ -7,9 +7,15 @@ public class Config
     [JsonPropertyName("transcription_engine")]
     public string TranscriptionEngine { get; set; } = null!;
 
+    [JsonPropertyName("secondary_engine")]
+    public string SecondaryEngine { get; set; } = "";
+
     [JsonPropertyName("openai_api_key")]
     public string OpenaiApiKey { get; set; } = null!;
 
+    [JsonPropertyName("upload_codec")]
+    public string UploadCodec { get; set; } = null!;
+
     [JsonPropertyName("audio_device")]
     public int AudioDevice { get; set; }
 }
@@ -12,4 +12,13 @@ public class MicConfig
 
     [JsonPropertyName("num_channels")]
     public int ChannelCount { get; set; }
+
+    [JsonPropertyName("chunk_size")]
+    public int ChunkSize { get; set; }
+
+    [JsonPropertyName("encoding")]
+    public string Encoding { get; set; } = "webm";
+
+    [JsonPropertyName("device_id")]
+    public string DeviceId { get; set; } = "";
 }
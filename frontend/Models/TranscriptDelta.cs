@@ -0,0 +1,27 @@
+using System.Text.Json.Serialization;
+
+namespace Models;
+
+public class TranscriptDelta
+{
+    [JsonPropertyName("phrase_id")]
+    public int PhraseId { get; set; }
+
+    [JsonPropertyName("revision")]
+    public int Revision { get; set; }
+
+    [JsonPropertyName("stable_length")]
+    public int StableLength { get; set; }
+
+    [JsonPropertyName("text")]
+    public string Text { get; set; } = "";
+
+    [JsonPropertyName("start")]
+    public double Start { get; set; }
+
+    [JsonPropertyName("end")]
+    public double End { get; set; }
+
+    [JsonPropertyName("final")]
+    public bool Final { get; set; }
+}
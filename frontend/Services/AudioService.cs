@@ -76,7 +76,7 @@ public class AudioService
 
     [JSInvokable]
     public async Task ConfigCallback(int sampleRate, int sampleWidth,
-    int channelCount)
+    int channelCount, string encoding, int chunkSize, string deviceId)
     {
         try
         {
@@ -90,7 +90,10 @@ public class AudioService
             {
                 SampleRate = sampleRate,
                 SampleWidth = sampleWidth,
-                ChannelCount = channelCount
+                ChannelCount = channelCount,
+                Encoding = encoding,
+                ChunkSize = chunkSize,
+                DeviceId = deviceId
             };
             await _socket!.SendAsync(config);
         }
@@ -1,4 +1,5 @@
 using System.Net.WebSockets;
+using System.Text.Json;
 
 namespace Services;
 
@@ -26,8 +27,9 @@ public class TranscriptionService
         _websocket_route = builder.Uri.ToString();
     }
 
-    public async Task ReceiveTextStreamAsync(Action<string> handler,
-    Action cancelCallback, CancellationToken cancellationToken = default)
+    public async Task ReceiveTranscriptStreamAsync(
+    Action<Models.TranscriptDelta> handler, Action cancelCallback,
+    CancellationToken cancellationToken = default)
     {
         _cancelCallback = cancelCallback;
         WebSocketConnection socket = new();
@@ -40,7 +42,9 @@ public class TranscriptionService
             {
                 message = await socket.ReceiveAsync<string>(cancellationToken);
                 if (message == null) break;
-                handler(message);
+
+                var delta = JsonSerializer.Deserialize<Models.TranscriptDelta>(message);
+                if (delta != null) handler(delta);
             }
         }
         catch (WebSocketException)
@@ -1,4 +1,5 @@
-const CHUNK_SIZE = 500; // milliseconds
+const CHUNK_SIZE = 500; // milliseconds, for WebM recordings
+const FRAME_SIZE = 20; // milliseconds, for raw PCM recordings
 const CONFIG = {
     audio: {
         sampleRate: 48000,
@@ -9,44 +10,88 @@ const CONFIG = {
 
 let mediaRecorder = null;
 let mediaStream = null;
+let audioContext = null;
 
 async function record(dotNetReference, callback, configCallback) {
-    if (mediaRecorder) {
+    if (mediaRecorder || audioContext) {
         console.log("Recording already in progress");
         return;
     }
 
     await navigator.mediaDevices.getUserMedia(CONFIG)
-        .then(stream => {
+        .then(async stream => {
             mediaStream = stream;
 
             // log active configuration
             const settings = stream.getAudioTracks()[0].getSettings();
             console.log(settings);
 
-            // send configuration to backend
-            dotNetReference.invokeMethodAsync(configCallback,
-                settings.sampleRate ?? CONFIG.audio.sampleRate,
-                settings.sampleSize ?? CONFIG.audio.sampleSize,
-                settings.channelCount ?? CONFIG.audio.channelCount,
-            );
-
-            // start recording
-            mediaRecorder = new MediaRecorder(stream);
-            mediaRecorder.start(CHUNK_SIZE);
-            mediaRecorder.ondataavailable = async (e) => {
-                const audioData = new Uint8Array(await e.data.arrayBuffer());
-                dotNetReference.invokeMethodAsync(callback, audioData);
-            };
+            // record raw PCM if supported, WebM otherwise
+            if (window.AudioWorkletNode) {
+                await recordPcm(stream, settings, dotNetReference, callback,
+                    configCallback);
+            } else {
+                await recordWebm(stream, settings, dotNetReference, callback,
+                    configCallback);
+            }
 
             console.log("Recording started");
         });
 }
 
+async function recordWebm(stream, settings, dotNetReference, callback,
+    configCallback) {
+    // send configuration to backend
+    await dotNetReference.invokeMethodAsync(configCallback,
+        settings.sampleRate ?? CONFIG.audio.sampleRate,
+        settings.sampleSize ?? CONFIG.audio.sampleSize,
+        settings.channelCount ?? CONFIG.audio.channelCount,
+        "webm", 1024, settings.deviceId ?? "",
+    );
+
+    // start recording
+    mediaRecorder = new MediaRecorder(stream);
+    mediaRecorder.start(CHUNK_SIZE);
+    mediaRecorder.ondataavailable = async (e) => {
+        const audioData = new Uint8Array(await e.data.arrayBuffer());
+        dotNetReference.invokeMethodAsync(callback, audioData);
+    };
+}
+
+async function recordPcm(stream, settings, dotNetReference, callback,
+    configCallback) {
+    audioContext = new AudioContext({
+        sampleRate: settings.sampleRate ?? CONFIG.audio.sampleRate
+    });
+    await audioContext.audioWorklet.addModule("pcmRecorder.js");
+    const frameSize = Math.round(audioContext.sampleRate * FRAME_SIZE / 1000);
+
+    // send configuration to backend
+    await dotNetReference.invokeMethodAsync(configCallback,
+        audioContext.sampleRate, 16, 1, "pcm", frameSize,
+        settings.deviceId ?? "",
+    );
+
+    // start recording
+    const source = audioContext.createMediaStreamSource(stream);
+    const recorder = new AudioWorkletNode(audioContext, "pcm-recorder", {
+        channelCount: 1,
+        channelCountMode: "explicit",
+        processorOptions: { frameSize: frameSize }
+    });
+    recorder.port.onmessage = (e) => {
+        dotNetReference.invokeMethodAsync(callback, new Uint8Array(e.data));
+    };
+    source.connect(recorder);
+}
+
 function stopRecording() {
     mediaRecorder?.stop();
     mediaRecorder = null;
 
+    audioContext?.close();
+    audioContext = null;
+
     mediaStream?.getTracks().forEach(track => track.stop());
     mediaStream = null;
 
@@ -0,0 +1,42 @@
+// AudioWorklet processor producing raw PCM frames for the backend.
+// Each frame is a little-endian header (uint32 sequence number, float64
+// capture timestamp in milliseconds) followed by 16-bit mono samples.
+const HEADER_SIZE = 12; // bytes
+
+class PcmRecorder extends AudioWorkletProcessor {
+    constructor(options) {
+        super();
+        this.frameSize = options.processorOptions.frameSize; // samples
+        this.samples = new Int16Array(this.frameSize);
+        this.length = 0; // samples in the current frame
+        this.sequence = 0;
+        this.timestamp = 0; // capture time of the current frame (ms)
+    }
+
+    process(inputs) {
+        const channel = inputs[0][0];
+        if (!channel) return true;
+
+        for (let i = 0; i < channel.length; i++) {
+            if (this.length === 0) {
+                this.timestamp = (currentTime + i / sampleRate) * 1000;
+            }
+            const sample = Math.max(-1, Math.min(1, channel[i]));
+            this.samples[this.length++] = sample * 0x7fff;
+            if (this.length === this.frameSize) this.flush();
+        }
+        return true;
+    }
+
+    flush() {
+        const frame = new ArrayBuffer(HEADER_SIZE + this.frameSize * 2);
+        const header = new DataView(frame);
+        header.setUint32(0, this.sequence++, true);
+        header.setFloat64(4, this.timestamp, true);
+        new Int16Array(frame, HEADER_SIZE).set(this.samples);
+        this.port.postMessage(frame, [frame]);
+        this.length = 0;
+    }
+}
+
+registerProcessor("pcm-recorder", PcmRecorder);